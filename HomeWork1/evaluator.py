@@ -0,0 +1,270 @@
+import ast
+import math
+import operator
+from functools import lru_cache, reduce
+
+import numpy as np
+
+# Безопасный вычислитель выражений. Дерево ast проверяется по белому списку узлов
+# и один раз превращается в цепочку замыканий, которая вычисляется без eval.
+# Скомпилированные выражения кэшируются по тексту, так что повторное вычисление
+# не разбирает строку заново
+
+COMPILE_CACHE_SIZE = 1024
+# Ограничение на показатель степени, чтобы 9**9**9 не занимал процесс
+MAX_EXPONENT = 1000
+# Ограничение на размер целого результата в битах: ((9**999)**999)**999 иначе
+# считается минутами, а целые длиннее 4300 цифр не сериализуются в JSON
+MAX_RESULT_BITS = 4096
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def check_size(value):
+    if isinstance(value, int) and value.bit_length() > MAX_RESULT_BITS:
+        raise ExpressionError("Result is too large")
+    return value
+
+
+# inf, nan и комплексные числа (например, (-8) ** 0.5) не представимы в JSON
+def check_finite(value):
+    if isinstance(value, complex):
+        raise ExpressionError("Result is not a real number")
+    if isinstance(value, float) and not math.isfinite(value):
+        raise ExpressionError("Result is not a finite number")
+    return value
+
+
+def safe_pow(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise ExpressionError(f"Exponent is too large: {exponent}")
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if exponent * math.log2(abs(base)) > MAX_RESULT_BITS:
+            raise ExpressionError("Result is too large")
+    return operator.pow(base, exponent)
+
+
+def array_pow(base, exponent):
+    if np.any(np.abs(exponent) > MAX_EXPONENT):
+        raise ExpressionError("Exponent is too large")
+    return np.power(base, exponent)
+
+
+# Операторы для каждого режима вычисления: "scalar" - одно значение,
+# "numpy" - сразу целые массивы входных данных
+BINARY_OPS = {
+    "scalar": {
+        ast.Add: operator.add,
+        ast.Sub: operator.sub,
+        ast.Mult: operator.mul,
+        ast.Div: operator.truediv,
+        ast.FloorDiv: operator.floordiv,
+        ast.Mod: operator.mod,
+        ast.Pow: safe_pow,
+    },
+    "numpy": {
+        ast.Add: np.add,
+        ast.Sub: np.subtract,
+        ast.Mult: np.multiply,
+        ast.Div: np.true_divide,
+        ast.FloorDiv: np.floor_divide,
+        ast.Mod: np.mod,
+        ast.Pow: array_pow,
+    },
+}
+
+UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+# Разрешенные функции и константы для каждого режима вычисления
+FUNCTIONS = {
+    "scalar": {
+        "abs": abs,
+        "round": round,
+        "min": min,
+        "max": max,
+        "sqrt": math.sqrt,
+        "exp": math.exp,
+        "log": math.log,
+        "sin": math.sin,
+        "cos": math.cos,
+        "tan": math.tan,
+    },
+    "numpy": {
+        "abs": np.abs,
+        "round": np.round,
+        "min": lambda *args: reduce(np.minimum, args),
+        "max": lambda *args: reduce(np.maximum, args),
+        "sqrt": np.sqrt,
+        "exp": np.exp,
+        "log": np.log,
+        "sin": np.sin,
+        "cos": np.cos,
+        "tan": np.tan,
+    },
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+
+class CompiledExpression:
+    def __init__(self, expr, func, variables, mode="scalar"):
+        self.expr = expr
+        self.func = func
+        self.variables = variables
+        self.mode = mode
+
+    def __call__(self, variables=None):
+        variables = variables or {}
+        missing = self.variables - variables.keys()
+        if missing:
+            raise ExpressionError(f"Missing variables: {', '.join(sorted(missing))}")
+        result = check_size(self.func(variables))
+        # в режиме numpy нечисловые элементы массива разбирает evaluate_columns
+        if self.mode == "scalar":
+            check_finite(result)
+        return result
+
+
+class _Compiler:
+    def __init__(self, mode):
+        self.binary_ops = BINARY_OPS[mode]
+        self.functions = FUNCTIONS[mode]
+        self.variables = set()
+
+    def compile(self, node):
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+        return method(node)
+
+    def _compile_Expression(self, node):
+        return self.compile(node.body)
+
+    def _compile_Constant(self, node):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ExpressionError(f"Unsupported constant: {value!r}")
+        return _constant(value)
+
+    def _compile_Name(self, node):
+        name = node.id
+        if name in CONSTANTS:
+            return _constant(CONSTANTS[name])
+        self.variables.add(name)
+        return lambda env: env[name]
+
+    def _compile_BinOp(self, node):
+        op = self.binary_ops.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        return self._fold(lambda env: op(left(env), right(env)), left, right)
+
+    def _compile_UnaryOp(self, node):
+        op = UNARY_OPS.get(type(node.op))
+        if op is None:
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        operand = self.compile(node.operand)
+        return self._fold(lambda env: op(operand(env)), operand)
+
+    def _compile_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in self.functions or node.keywords:
+            raise ExpressionError("Unsupported function call")
+        func = self.functions[node.func.id]
+        args = [self.compile(arg) for arg in node.args]
+        return self._fold(lambda env: func(*[arg(env) for arg in args]), *args)
+
+    # Подвыражения без переменных вычисляются один раз при компиляции
+    @staticmethod
+    def _fold(func, *children):
+        if all(hasattr(child, "value") for child in children):
+            try:
+                return _constant(check_size(func({})))
+            except (ArithmeticError, ValueError):
+                # ошибку (например, деление на ноль или слишком большой результат)
+                # оставляем до вычисления
+                return func
+        return func
+
+
+def _constant(value):
+    func = lambda env: value
+    func.value = value
+    return func
+
+
+@lru_cache(maxsize=COMPILE_CACHE_SIZE)
+def compile_expression(expr, mode="scalar"):
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}") from None
+    compiler = _Compiler(mode)
+    func = compiler.compile(tree)
+    return CompiledExpression(expr, func, frozenset(compiler.variables), mode)
+
+
+# Векторное вычисление: columns - словарь "переменная -> массив значений длины size".
+# Возвращает массив результатов и словарь ошибок по индексам элементов;
+# элементы, у которых уже на входе NaN, считаются ошибками вызывающей стороны
+def evaluate_columns(expr, columns, size):
+    arrays = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    with np.errstate(all="ignore"):
+        result = compile_expression(expr, "numpy")(arrays)
+    result = np.broadcast_to(np.asarray(result, dtype=np.float64), (size,))
+
+    errors = {}
+    bad = ~np.isfinite(result)
+    if bad.any():
+        valid_inputs = np.ones(size, dtype=bool)
+        for values in arrays.values():
+            valid_inputs &= ~np.isnan(values)
+        for index in np.flatnonzero(bad & valid_inputs):
+            errors[int(index)] = "Division by zero or overflow" if np.isinf(result[index]) else "Invalid value"
+    return result, errors
+
+
+# Операции модели Operation по имени или знаку
+OPERATIONS = {
+    "add": np.add,
+    "+": np.add,
+    "subtract": np.subtract,
+    "-": np.subtract,
+    "multiply": np.multiply,
+    "*": np.multiply,
+    "divide": np.true_divide,
+    "/": np.true_divide,
+}
+
+
+# Пакет операций: элементы группируются по op, и каждая группа считается одним
+# вызовом numpy. Возвращает массив результатов и словарь ошибок по индексам
+def apply_operations(ops, a, b):
+    ops = np.asarray(ops, dtype=object)
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    result = np.full(len(ops), np.nan)
+    errors = {}
+    for op in set(ops.tolist()):
+        mask = ops == op
+        func = OPERATIONS.get(op)
+        if func is None:
+            for index in np.flatnonzero(mask):
+                errors[int(index)] = f"Unknown operation: {op}"
+            continue
+        if func is np.true_divide:
+            for index in np.flatnonzero(mask & (b == 0)):
+                errors[int(index)] = "Division by zero"
+            mask &= b != 0
+        with np.errstate(all="ignore"):
+            result[mask] = func(a[mask], b[mask])
+    return result, errors
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Хранилище текущих выражений по идентификатору сессии. Память процесса подходит для
+# одного воркера; SQLite-файл общий для всех воркеров uvicorn на одной машине
+
+TRIM_EVERY = 1000
+
+
+class MemoryExpressionStore:
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._expressions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            expr = self._expressions.get(session_id)
+            if expr is not None:
+                self._expressions.move_to_end(session_id)
+            return expr
+
+    def set(self, session_id, expr):
+        with self._lock:
+            self._expressions[session_id] = expr
+            self._expressions.move_to_end(session_id)
+            # вытесняем давно не использованные сессии
+            while len(self._expressions) > self.max_sessions:
+                self._expressions.popitem(last=False)
+
+
+class SQLiteExpressionStore:
+    def __init__(self, path="expressions.db", max_sessions=100000):
+        self.path = path
+        self.max_sessions = max_sessions
+        # у каждого потока свое соединение: sqlite3 не разрешает делить их между потоками
+        self._local = threading.local()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS expressions ("
+                "session_id TEXT PRIMARY KEY, expression TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_expressions_updated_at ON expressions (updated_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+        return conn
+
+    def get(self, session_id):
+        row = self._connect().execute(
+            "SELECT expression FROM expressions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, session_id, expr):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO expressions (session_id, expression, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET expression = excluded.expression, "
+                "updated_at = excluded.updated_at",
+                (session_id, expr, time.time()),
+            )
+            # лишние старые сессии удаляем раз в TRIM_EVERY записей, а не на каждой
+            self._writes += 1
+            if self._writes % TRIM_EVERY:
+                return
+            conn.execute(
+                "DELETE FROM expressions WHERE session_id IN ("
+                "SELECT session_id FROM expressions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+
+
+def create_store(backend, path="expressions.db"):
+    if backend == "memory":
+        return MemoryExpressionStore()
+    if backend == "sqlite":
+        return SQLiteExpressionStore(path)
+    raise ValueError(f"Unknown expression store backend: {backend}")
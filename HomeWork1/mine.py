@@ -1,22 +1,50 @@
-from fastapi import FastAPI, HTTPException  
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Body  
+from fastapi.concurrency import run_in_threadpool  
 from pydantic import BaseModel  
-import ast  
+from typing import Dict, List, Optional  
 import operator  
+import json  
+import math  
+import os  
+import uuid  
+from expression_store import create_store  
+from evaluator import compile_expression, evaluate_columns, apply_operations  
 
 app = FastAPI()  
 
-# Хранит текущее выражение  
-current_expression = ""  
+# Текущее выражение хранится отдельно для каждой сессии: в памяти процесса  
+# или в общем SQLite-файле, если приложение запущено в нескольких воркерах  
+EXPRESSION_STORE = os.getenv("EXPRESSION_STORE", "memory")  
+EXPRESSION_DB = os.getenv("EXPRESSION_DB", "expressions.db")  
+SESSION_COOKIE = "session_id"  
+SESSION_HEADER = "X-Session-Id"  
+MAX_BATCH_SIZE = 100000  
+
+expression_store = create_store(EXPRESSION_STORE, EXPRESSION_DB)  
+
+# Идентификатор сессии берется из cookie или заголовка; новой сессии выдаем cookie  
+def get_session_id(request: Request, response: Response) -> str:  
+    session_id = request.cookies.get(SESSION_COOKIE) or request.headers.get(SESSION_HEADER)  
+    if not session_id:  
+        session_id = uuid.uuid4().hex  
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True)  
+    return session_id  
 
 # Функция для безопасного выполнения математического выражения  
-def eval_expression(expr: str) -> float:  
+def eval_expression(expr: str, variables: Optional[Dict[str, float]] = None) -> float:  
     try:  
-        # Используем ast для безопасного парсинга выражений  
-        node = ast.parse(expr, mode='eval')  
-        return eval(compile(node, '', mode='eval'))  
+        # Выражение разбирается и проверяется один раз, дальше берется из кэша  
+        return compile_expression(expr)(variables)  
     except Exception as e:  
         raise HTTPException(status_code=400, detail=str(e))  
 
+# Пакетное вычисление: значения переменных передаются столбцами  
+# ({"x": [1, 2], "y": [3, 4]}) или списком наборов ([{"x": 1, "y": 3}, ...])  
+class BatchEvaluation(BaseModel):  
+    expression: str  
+    columns: Optional[Dict[str, List[float]]] = None  
+    bindings: Optional[List[Dict[str, float]]] = None  
+
 class Operation(BaseModel):  
     a: float  
     b: float  
@@ -41,20 +69,134 @@ def divide(operation: Operation):
     return {"result": operation.a / operation.b}  
 
 @app.post("/create_expression/")  
-def create_expression(expr: str):  
-    global current_expression  
-    current_expression = expr  
-    return {"expression": current_expression}  
+def create_expression(expr: str, session_id: str = Depends(get_session_id)):  
+    expression_store.set(session_id, expr)  
+    return {"expression": expr}  
 
 @app.get("/current_expression/")  
-def get_current_expression():  
-    return {"current_expression": current_expression}  
+def get_current_expression(session_id: str = Depends(get_session_id)):  
+    return {"current_expression": expression_store.get(session_id) or ""}  
 
 @app.post("/evaluate/")  
-def evaluate_expression():  
+def evaluate_expression(  
+    variables: Optional[Dict[str, float]] = Body(None, embed=True),  
+    session_id: str = Depends(get_session_id),  
+):  
+    current_expression = expression_store.get(session_id)  
     if not current_expression:  
         raise HTTPException(status_code=400, detail="No expression to evaluate")  
-    return {"result": eval_expression(current_expression)}  
+    return {"result": eval_expression(current_expression, variables)}  
+
+@app.post("/evaluate/batch")  
+def evaluate_batch(batch: BatchEvaluation):  
+    if (batch.columns is None) == (batch.bindings is None):  
+        raise HTTPException(status_code=400, detail="Pass either columns or bindings")  
+
+    errors = {}  
+    if batch.columns is not None:  
+        sizes = {len(values) for values in batch.columns.values()}  
+        if len(sizes) > 1:  
+            raise HTTPException(status_code=400, detail="Columns must have the same length")  
+        size = sizes.pop() if sizes else 1  
+        columns = batch.columns  
+    else:  
+        size = len(batch.bindings)  
+        # каждый набор проверяется по переменным самого выражения: лишние ключи  
+        # не нужны, а отсутствующая переменная - ошибка только этого элемента  
+        try:  
+            names = compile_expression(batch.expression).variables  
+        except Exception as e:  
+            raise HTTPException(status_code=400, detail=str(e))  
+        columns = {name: [binding.get(name, float("nan")) for binding in batch.bindings] for name in names}  
+        for index, binding in enumerate(batch.bindings):  
+            missing = names - binding.keys()  
+            if missing:  
+                errors[index] = f"Missing variables: {', '.join(sorted(missing))}"  
+    if size > MAX_BATCH_SIZE:  
+        raise HTTPException(status_code=400, detail=f"Batch is larger than {MAX_BATCH_SIZE}")  
+
+    try:  
+        result, eval_errors = evaluate_columns(batch.expression, columns, size)  
+    except Exception as e:  
+        raise HTTPException(status_code=400, detail=str(e))  
+    errors.update(eval_errors)  
+
+    results = result.tolist()  
+    for index in errors:  
+        results[index] = None  
+    return {  
+        "results": results,  
+        "errors": [{"index": index, "error": error} for index, error in sorted(errors.items())],  
+    }  
+
+# Элементы пакета операций: из JSON-массива целиком или построчно из потока NDJSON  
+# (строки NDJSON разбираются позже, чтобы ошибка в одной строке не ломала весь пакет).  
+# Строки NDJSON считаются по мере чтения: слишком большой пакет отклоняется, не дочитывая тело  
+async def read_operation_items(request: Request):  
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):  
+        items = []  
+        buffer = b""  
+        async for chunk in request.stream():  
+            buffer += chunk  
+            *lines, buffer = buffer.split(b"\n")  
+            items.extend(line for line in lines if line.strip())  
+            if len(items) > MAX_BATCH_SIZE:  
+                raise HTTPException(status_code=400, detail=f"Batch is larger than {MAX_BATCH_SIZE}")  
+        if buffer.strip():  
+            items.append(buffer)  
+        return items  
+    try:  
+        items = json.loads(await request.body())  
+    except ValueError:  
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")  
+    if not isinstance(items, list):  
+        raise HTTPException(status_code=400, detail="Body must be a JSON list or NDJSON")  
+    return items  
+
+def compute_operations(items):  
+    errors = {}  
+    ops, a, b = [], [], []  
+    for index, item in enumerate(items):  
+        try:  
+            if isinstance(item, bytes):  
+                item = json.loads(item)  
+            if not isinstance(item, dict):  
+                raise TypeError("Item must be a JSON object")  
+            operation = Operation(**item)  
+        except (TypeError, ValueError) as e:  
+            errors[index] = str(e)  
+            ops.append(None)  
+            a.append(0.0)  
+            b.append(0.0)  
+            continue  
+        ops.append(operation.op)  
+        a.append(operation.a)  
+        b.append(operation.b)  
+
+    valid = [index for index in range(len(items)) if index not in errors]  
+    result, op_errors = apply_operations([ops[i] for i in valid], [a[i] for i in valid], [b[i] for i in valid])  
+    results = [None] * len(items)  
+    for position, index in enumerate(valid):  
+        value = float(result[position])  
+        if position in op_errors:  
+            errors[index] = op_errors[position]  
+        elif not math.isfinite(value):  
+            # inf и nan не представимы в JSON  
+            errors[index] = "Overflow" if math.isinf(value) else "Invalid value"  
+        else:  
+            results[index] = value  
+    return {  
+        "results": results,  
+        "errors": [{"index": index, "error": error} for index, error in sorted(errors.items())],  
+    }  
+
+@app.post("/operations/batch")  
+async def operations_batch(request: Request):  
+    items = await read_operation_items(request)  
+    if len(items) > MAX_BATCH_SIZE:  
+        raise HTTPException(status_code=400, detail=f"Batch is larger than {MAX_BATCH_SIZE}")  
+    # расчет на numpy выполняется вне цикла событий  
+    return await run_in_threadpool(compute_operations, items)  
 
 if __name__ == "__main__":  
     import uvicorn  
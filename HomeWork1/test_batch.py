@@ -0,0 +1,166 @@
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+import mine
+
+client = TestClient(mine.app)
+
+def evaluate_batch(**body):
+    return client.post("/evaluate/batch", json=body)
+
+def ndjson(*lines):
+    return "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode()
+
+def test_evaluate_batch_columns():
+    """Тест пакетного вычисления по столбцам"""
+    response = evaluate_batch(expression="x * y + 1", columns={"x": [1, 2, 3], "y": [4, 5, 6]})
+    assert response.status_code == 200
+    assert response.json() == {"results": [5.0, 11.0, 19.0], "errors": []}
+
+def test_evaluate_batch_bindings():
+    """Тест пакетного вычисления по наборам переменных"""
+    response = evaluate_batch(expression="x - y", bindings=[{"x": 5, "y": 1}, {"x": 1, "y": 2, "z": 9}])
+    assert response.json() == {"results": [4.0, -1.0], "errors": []}
+    # выражение без переменных вычисляется для каждого набора
+    response = evaluate_batch(expression="2 + 2", bindings=[{}, {"x": 1}])
+    assert response.json()["results"] == [4.0, 4.0]
+
+def test_evaluate_batch_columns_or_bindings():
+    """Тест выбора между столбцами и наборами"""
+    assert evaluate_batch(expression="x").status_code == 400
+    response = evaluate_batch(expression="x", columns={"x": [1]}, bindings=[{"x": 1}])
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Pass either columns or bindings"
+
+def test_evaluate_batch_element_errors():
+    """Тест ошибок отдельных элементов пакета"""
+    response = evaluate_batch(expression="1 / x + sqrt(y)", columns={"x": [1, 0, 2], "y": [4, 4, -1]})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] == [3.0, None, None]
+    assert data["errors"] == [
+        {"index": 1, "error": "Division by zero or overflow"},
+        {"index": 2, "error": "Invalid value"},
+    ]
+
+def test_evaluate_batch_missing_variables():
+    """Тест отсутствующих переменных в наборах"""
+    response = evaluate_batch(expression="x + y", bindings=[{"x": 1, "y": 2}, {"x": 1}, {}])
+    data = response.json()
+    assert data["results"] == [3.0, None, None]
+    assert data["errors"] == [
+        {"index": 1, "error": "Missing variables: y"},
+        {"index": 2, "error": "Missing variables: x, y"},
+    ]
+    # в режиме столбцов недостающая переменная - ошибка всего пакета
+    response = evaluate_batch(expression="x + y", columns={"x": [1, 2]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Missing variables: y"
+
+def test_evaluate_batch_invalid_request():
+    """Тест столбцов разной длины и неверного выражения"""
+    response = evaluate_batch(expression="x + y", columns={"x": [1, 2], "y": [1]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Columns must have the same length"
+    assert evaluate_batch(expression="x +", bindings=[{"x": 1}]).status_code == 400
+    assert evaluate_batch(expression="x.real", columns={"x": [1]}).status_code == 400
+
+def test_evaluate_batch_size_limit(monkeypatch):
+    """Тест ограничения размера пакета вычислений"""
+    monkeypatch.setattr(mine, "MAX_BATCH_SIZE", 3)
+    assert evaluate_batch(expression="x", columns={"x": [1, 2, 3]}).status_code == 200
+    for body in ({"columns": {"x": [1, 2, 3, 4]}}, {"bindings": [{"x": 1}] * 4}):
+        response = evaluate_batch(expression="x", **body)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Batch is larger than 3"
+
+def test_operations_batch_json_and_ndjson():
+    """Тест пакета операций в виде JSON-массива и NDJSON"""
+    items = [{"a": 6, "b": 3, "op": "divide"}, {"a": 2, "b": 3, "op": "*"}, {"a": 1, "b": 2, "op": "-"}]
+    expected = {"results": [2.0, 6.0, -1.0], "errors": []}
+    assert client.post("/operations/batch", json=items).json() == expected
+    # пустые строки NDJSON пропускаются, последняя строка может быть без перевода строки
+    response = client.post("/operations/batch", content=ndjson(items[0], "", items[1], items[2]),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.json() == expected
+
+def test_operations_batch_item_errors():
+    """Тест ошибок отдельных операций пакета"""
+    items = [
+        {"a": 1, "b": 2, "op": "add"},
+        {"a": 1, "b": 2, "op": "power"},
+        {"a": 1, "b": 0, "op": "/"},
+        {"a": 1e308, "b": 10, "op": "multiply"},
+        {"a": 1, "op": "+"},
+        [1, 2],
+        {"a": 3, "b": 1, "op": "subtract"},
+    ]
+    response = client.post("/operations/batch", json=items)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] == [3.0, None, None, None, None, None, 2.0]
+    errors = {error["index"]: error["error"] for error in data["errors"]}
+    assert sorted(errors) == [1, 2, 3, 4, 5]
+    assert errors[1] == "Unknown operation: power"
+    assert errors[2] == "Division by zero"
+    assert errors[3] == "Overflow"
+    assert "b" in errors[4]
+    assert errors[5] == "Item must be a JSON object"
+
+def test_operations_batch_broken_ndjson_line():
+    """Тест испорченной строки NDJSON"""
+    body = ndjson({"a": 1, "b": 1, "op": "+"}, "{broken", {"a": 2, "b": 2, "op": "+"})
+    data = client.post("/operations/batch", content=body,
+        headers={"Content-Type": "application/x-ndjson"}
+    ).json()
+    assert data["results"] == [2.0, None, 4.0]
+    assert [error["index"] for error in data["errors"]] == [1]
+
+def test_operations_batch_invalid_body():
+    """Тест тела запроса, которое не является списком"""
+    for body in (b"{broken", b'{"a": 1, "b": 2, "op": "+"}'):
+        response = client.post("/operations/batch", content=body,
+            headers={"Content-Type": "application/json"}
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Body must be a JSON list or NDJSON"
+
+def test_operations_batch_size_limit(monkeypatch):
+    """Тест ограничения размера пакета операций"""
+    monkeypatch.setattr(mine, "MAX_BATCH_SIZE", 3)
+    item = {"a": 1, "b": 2, "op": "+"}
+    assert client.post("/operations/batch", json=[item] * 3).status_code == 200
+    response = client.post("/operations/batch", json=[item] * 4)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Batch is larger than 3"
+    # последняя строка без перевода строки тоже считается
+    response = client.post("/operations/batch", content=ndjson(*[item] * 4),
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 400
+
+def test_operations_stream_stops_at_size_limit(monkeypatch):
+    """Тест отказа для слишком большого NDJSON, не дочитывая тело"""
+    monkeypatch.setattr(mine, "MAX_BATCH_SIZE", 3)
+    chunks = [ndjson({"a": number, "b": 1, "op": "+"}) + b"\n" for number in range(100)]
+    received = []
+
+    async def receive():
+        received.append(chunks[len(received)])
+        return {"type": "http.request", "body": received[-1], "more_body": len(received) < len(chunks)}
+
+    request = Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/operations/batch",
+        "headers": [(b"content-type", b"application/x-ndjson")],
+    }, receive)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(mine.read_operation_items(request))
+    assert error.value.status_code == 400
+    # чтение остановилось на первой лишней строке
+    assert len(received) == 4
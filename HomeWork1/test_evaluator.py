@@ -0,0 +1,82 @@
+import pytest
+import evaluator
+from evaluator import ExpressionError, compile_expression
+
+@pytest.mark.parametrize("expr", [
+    "__import__('os')",
+    "(1).__class__",
+    "x.real",
+    "open('file')",
+    "abs.__call__(1)",
+    "[1, 2]",
+    "x if y else z",
+    "lambda: 1",
+    "1 < 2",
+    "'text'",
+    "True + 1",
+])
+def test_rejects_unsupported_syntax(expr):
+    """Тест отказа для узлов вне белого списка, атрибутов и вызовов"""
+    with pytest.raises(ExpressionError):
+        compile_expression(expr)
+
+def test_rejects_invalid_expression():
+    """Тест синтаксической ошибки в выражении"""
+    with pytest.raises(ExpressionError, match="Invalid expression"):
+        compile_expression("1 +")
+
+def test_allowed_functions_and_constants():
+    """Тест разрешенных функций и констант"""
+    assert compile_expression("max(1, 2) + abs(-3)")() == 5
+    assert compile_expression("round(pi, 2)")() == 3.14
+    with pytest.raises(ExpressionError, match="Unsupported function call"):
+        compile_expression("max(1, key=abs)")
+
+def test_exponent_limit():
+    """Тест ограничения показателя степени"""
+    assert compile_expression("2 ** 10")() == 1024
+    with pytest.raises(ExpressionError, match="Exponent is too large"):
+        compile_expression("9 ** 9 ** 9")()
+    with pytest.raises(ExpressionError, match="Exponent is too large"):
+        compile_expression("x ** y")({"x": 2, "y": evaluator.MAX_EXPONENT + 1})
+
+def test_result_size_limit():
+    """Тест ограничения размера результата"""
+    with pytest.raises(ExpressionError, match="Result is too large"):
+        compile_expression("9 ** 999 * 9 ** 999")()
+    with pytest.raises(ExpressionError, match="Result is too large"):
+        compile_expression("x ** 999")({"x": 2 ** 100})
+    # результат в пределах MAX_RESULT_BITS вычисляется
+    assert compile_expression("2 ** 999")() == 2 ** 999
+
+def test_non_finite_result():
+    """Тест результатов, не представимых в JSON"""
+    with pytest.raises(ExpressionError, match="not a finite number"):
+        compile_expression("1e308 * 10")()
+    with pytest.raises(ExpressionError, match="not a finite number"):
+        compile_expression("x * x")({"x": 1e200})
+    with pytest.raises(ExpressionError, match="not a real number"):
+        compile_expression("(-8) ** 0.5")()
+
+def test_variables():
+    """Тест подстановки переменных и отсутствующих переменных"""
+    compiled = compile_expression("x * 2 + y - pi * 0")
+    assert compiled.variables == {"x", "y"}
+    assert compiled({"x": 3, "y": 1}) == 7
+    # лишние переменные не мешают
+    assert compiled({"x": 1, "y": 1, "z": 100}) == 3
+    with pytest.raises(ExpressionError, match="Missing variables: y"):
+        compiled({"x": 3})
+    with pytest.raises(ExpressionError, match="Missing variables: x, y"):
+        compiled()
+
+def test_compile_cache():
+    """Тест кэша скомпилированных выражений"""
+    compile_expression.cache_clear()
+    first = compile_expression("x + 1")
+    assert compile_expression("x + 1") is first
+    # режим вычисления - часть ключа кэша
+    assert compile_expression("x + 1", "numpy") is not first
+    info = compile_expression.cache_info()
+    assert (info.hits, info.misses) == (1, 2)
+    assert info.maxsize == evaluator.COMPILE_CACHE_SIZE
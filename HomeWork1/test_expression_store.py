@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import pytest
+import expression_store
+from expression_store import MemoryExpressionStore, SQLiteExpressionStore, create_store
+
+def test_memory_store_evicts_least_recently_used():
+    """Тест вытеснения давно не использованных сессий из памяти"""
+    store = MemoryExpressionStore(max_sessions=2)
+    store.set("a", "1 + 1")
+    store.set("b", "2 + 2")
+    # чтение продлевает жизнь сессии
+    assert store.get("a") == "1 + 1"
+    store.set("c", "3 + 3")
+
+    assert store.get("b") is None
+    assert store.get("a") == "1 + 1"
+    assert store.get("c") == "3 + 3"
+
+def test_sqlite_store_trims_old_sessions(monkeypatch):
+    """Тест удаления лишних старых сессий из SQLite"""
+    monkeypatch.setattr(expression_store, "TRIM_EVERY", 4)
+    path = os.path.join(tempfile.mkdtemp(), "expressions.db")
+    store = SQLiteExpressionStore(path, max_sessions=2)
+
+    for index in range(3):
+        store.set(f"s{index}", f"{index} + 1")
+    # до очередной чистки лишние сессии остаются
+    assert store.get("s0") == "0 + 1"
+    store.set("s3", "3 + 1")
+
+    assert store.get("s0") is None
+    assert store.get("s1") is None
+    assert store.get("s2") == "2 + 1"
+    assert store.get("s3") == "3 + 1"
+
+def test_sqlite_store_reopen():
+    """Тест повторного открытия файла хранилища другим воркером"""
+    path = os.path.join(tempfile.mkdtemp(), "expressions.db")
+    first = SQLiteExpressionStore(path)
+    first.set("session", "x * 2")
+
+    # новый экземпляр на том же файле (другой воркер) видит сохраненное выражение
+    second = create_store("sqlite", path)
+    assert second.get("session") == "x * 2"
+    # режим WAL сохраняется в файле базы
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # запись второго экземпляра видна первому, в том числе из другого потока
+    second.set("session", "x * 3")
+    result = []
+    thread = threading.Thread(target=lambda: result.append(first.get("session")))
+    thread.start()
+    thread.join()
+    assert result == ["x * 3"]
+    assert first.get("session") == "x * 3"
+
+def test_create_store_unknown_backend():
+    """Тест неизвестного типа хранилища"""
+    with pytest.raises(ValueError, match="Unknown expression store backend"):
+        create_store("redis")
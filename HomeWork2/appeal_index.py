@@ -0,0 +1,122 @@
+import os
+import sqlite3
+import threading
+
+from appeal_store import iter_records, list_segments, iter_segment
+
+# Вторичный индекс обращений в SQLite рядом с журналом. Журнал остается основным
+# хранилищем: индекс можно удалить и перестроить по сегментам командой reindex
+
+INDEXED_FIELDS = ("last_name", "first_name", "birth_date", "phone_number", "email", "submitted_at")
+REBUILD_CHUNK = 10000
+
+
+class AppealIndex:
+    def __init__(self, path="appeals.db"):
+        self.path = path
+        # у каждого потока свое соединение: sqlite3 не разрешает делить их между потоками
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS appeals ("
+                "id INTEGER PRIMARY KEY, segment TEXT NOT NULL, byte_offset INTEGER NOT NULL, "
+                "last_name TEXT, first_name TEXT, birth_date TEXT, phone_number TEXT, "
+                "email TEXT, submitted_at TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_appeals_email ON appeals (email)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_appeals_last_name ON appeals (last_name, first_name)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_appeals_phone_number ON appeals (phone_number)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_appeals_birth_date ON appeals (birth_date)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    def _row(segment, offset, record):
+        values = (record.get(field) for field in INDEXED_FIELDS)
+        return (record["id"], segment, offset, *(None if value is None else str(value) for value in values))
+
+    # Обычный INSERT: повторно выданный id - ошибка журнала, а не повод перезаписать
+    # уже проиндексированное обращение
+    def _insert(self, conn, rows):
+        conn.executemany(
+            "INSERT INTO appeals (id, segment, byte_offset, " + ", ".join(INDEXED_FIELDS) + ") "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    # Вызывается потоком журнала после fsync группы записей, под блокировкой журнала
+    def add(self, entries):
+        with self._connect() as conn:
+            self._insert(conn, [self._row(segment, offset, record) for segment, offset, record in entries])
+
+    # Дописывает в индекс записи журнала, которых в нем еще нет (например, после сбоя
+    # между fsync журнала и записью индекса). Просматриваются только сегменты начиная
+    # с сегмента последней проиндексированной записи
+    def catch_up(self, directory):
+        conn = self._connect()
+        last = conn.execute("SELECT id, segment FROM appeals ORDER BY id DESC LIMIT 1").fetchone()
+        last_id, first_segment = (last["id"], last["segment"]) if last else (0, "")
+        rows = []
+        with conn:
+            for name in list_segments(directory):
+                if name < first_segment:
+                    continue
+                for offset, record in iter_segment(os.path.join(directory, name)):
+                    if record["id"] > last_id:
+                        rows.append(self._row(name, offset, record))
+                    if len(rows) >= REBUILD_CHUNK:
+                        self._insert(conn, rows)
+                        rows = []
+            self._insert(conn, rows)
+
+    # Полная перестройка индекса по журналу одной транзакцией
+    def rebuild(self, directory):
+        conn = self._connect()
+        count = 0
+        rows = []
+        with conn:
+            conn.execute("DELETE FROM appeals")
+            for name, offset, record in iter_records(directory):
+                rows.append(self._row(name, offset, record))
+                if len(rows) >= REBUILD_CHUNK:
+                    self._insert(conn, rows)
+                    count += len(rows)
+                    rows = []
+            self._insert(conn, rows)
+            count += len(rows)
+        return count
+
+    def search(self, email=None, last_name=None, first_name=None, phone_number=None,
+               birth_date_from=None, birth_date_to=None, skip=0, limit=50):
+        conditions = []
+        params = []
+        for column, value in (("email", email), ("last_name", last_name),
+                              ("first_name", first_name), ("phone_number", phone_number)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if birth_date_from is not None:
+            conditions.append("birth_date >= ?")
+            params.append(str(birth_date_from))
+        if birth_date_to is not None:
+            conditions.append("birth_date <= ?")
+            params.append(str(birth_date_to))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._connect().execute(
+            f"SELECT id, {', '.join(INDEXED_FIELDS)} FROM appeals {where} ORDER BY id LIMIT ? OFFSET ?",
+            (*params, limit, skip),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,366 @@
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import queue
+import shutil
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+
+# Хранилище обращений - журнал только на дозапись. Обращения пишутся строками NDJSON
+# в сегменты appeals/00000001.ndjson, ...; при превышении размера открывается новый
+# сегмент. Запись идет в отдельном потоке: все обращения, пришедшие, пока поток был
+# занят, записываются одним write и подтверждаются одним fsync (group commit).
+# В один журнал могут писать несколько процессов (воркеры uvicorn): каждая группа
+# пишется под блокировкой flock файла appeals/.lock, а id выдаются после перечитывания
+# хвоста журнала под этой блокировкой
+
+SEGMENT_SUFFIX = ".ndjson"
+LOCK_NAME = ".lock"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+MAX_GROUP_SIZE = 10000
+# Файлы обращений старой версии submit_appeal и их имена после импорта в журнал
+LEGACY_SUFFIX = ".json"
+IMPORTED_SUFFIX = ".imported"
+
+
+def segment_name(index):
+    return f"{index:08d}{SEGMENT_SUFFIX}"
+
+
+def list_segments(directory):
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+
+
+def iter_segment(path):
+    # (смещение, запись) для каждой целой строки сегмента
+    with open(path, "rb") as f:
+        offset = 0
+        for line in f:
+            if line.endswith(b"\n"):
+                try:
+                    yield offset, json.loads(line)
+                except ValueError:
+                    pass
+            offset += len(line)
+
+
+def iter_records(directory):
+    for name in list_segments(directory):
+        for offset, record in iter_segment(os.path.join(directory, name)):
+            yield name, offset, record
+
+
+class AppealLog:
+    # on_commit(entries) вызывается в потоке записи после fsync каждой группы,
+    # entries - список (сегмент, смещение, запись)
+    def __init__(self, directory="appeals", max_segment_bytes=DEFAULT_SEGMENT_BYTES, fsync=True, on_commit=None):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        self.fsync = fsync
+        self.on_commit = on_commit
+        self._queue = queue.Queue()
+        self._thread = None
+        self._file = None
+        self._segment_index = 0
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._lock_file = None
+
+    def open(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            with self.locked():
+                self._recover()
+            self._thread = threading.Thread(target=self._run, name="appeal-log-writer", daemon=True)
+            self._thread.start()
+
+    # Межпроцессная блокировка журнала: пока она удерживается, другие процессы
+    # не пишут в журнал и не обновляют индекс
+    @contextmanager
+    def locked(self):
+        if self._lock_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock_file = open(os.path.join(self.directory, LOCK_NAME), "ab")
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    # Вызывается под блокировкой. Обрезаем недописанную после сбоя строку, переходим
+    # на последний сегмент и находим последний выданный id
+    def _recover(self):
+        segments = list_segments(self.directory)
+        if not segments:
+            self._open_segment(1)
+            return
+        self._last_id = 0
+        for name in reversed(segments):
+            path = os.path.join(self.directory, name)
+            last_record = self._truncate_torn_tail(path)
+            if last_record is not None:
+                self._last_id = last_record["id"]
+                break
+        self._open_segment(int(segments[-1][:-len(SEGMENT_SUFFIX)]))
+
+    # Пока в журнал писал только этот процесс, последний сегмент - наш и его размер
+    # совпадает с позицией записи; иначе хвост перечитывается
+    def _refresh_tail(self):
+        segments = list_segments(self.directory)
+        if (self._file is not None and segments and segments[-1] == segment_name(self._segment_index)
+                and os.fstat(self._file.fileno()).st_size == self._file.tell()):
+            return
+        self._recover()
+
+    @staticmethod
+    def _truncate_torn_tail(path):
+        with open(path, "r+b") as f:
+            size = f.seek(0, os.SEEK_END)
+            chunk = 64 * 1024
+            while True:
+                start = max(0, size - chunk)
+                f.seek(start)
+                data = f.read(size - start)
+                end = data.rfind(b"\n")
+                if end != -1 or start == 0:
+                    break
+                chunk *= 2
+            valid_size = start + end + 1 if end != -1 else 0
+            if valid_size != size:
+                f.truncate(valid_size)
+            if valid_size == 0:
+                return None
+            line_start = data.rfind(b"\n", 0, end) + 1
+            return json.loads(data[line_start:end])
+
+    def _open_segment(self, index):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+        self._segment_index = index
+        self._file = open(os.path.join(self.directory, segment_name(index)), "ab")
+
+    def _sync(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    # Ставит записи в очередь; Future получит список (id, сегмент, смещение)
+    def submit(self, records):
+        if self._thread is None:
+            self.open()
+        future = Future()
+        self._queue.put((records, future))
+        return future
+
+    async def append(self, records):
+        return await asyncio.wrap_future(self.submit(records))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            group = [item]
+            count = len(item[0])
+            stop = False
+            while count < MAX_GROUP_SIZE:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                group.append(item)
+                count += len(item[0])
+            # отмененные до записи запросы (клиент отключился) не пишем
+            group = [item for item in group if item[1].set_running_or_notify_cancel()]
+            if group:
+                self._write_group(group)
+            if stop:
+                break
+
+    def _write_group(self, group):
+        with self.locked():
+            try:
+                self._refresh_tail()
+                results, entries = self._write_records(group)
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+                return
+            # индекс обновляется под той же блокировкой: catch_up другого процесса
+            # не проиндексирует эти записи раньше нас
+            if self.on_commit is not None:
+                try:
+                    self.on_commit(entries)
+                except Exception as e:
+                    # записи уже в журнале; отставший индекс догонит catch_up или reindex
+                    print(f"Appeal log on_commit failed: {e}")
+        for (_, future), locations in zip(group, results):
+            future.set_result(locations)
+
+    def _write_records(self, group):
+        results = []
+        entries = []
+        buffer = bytearray()
+        position = self._file.tell()
+        submitted_at = datetime.now().isoformat(timespec="seconds")
+        for records, _ in group:
+            locations = []
+            for record in records:
+                self._last_id += 1
+                record = {"id": self._last_id, "submitted_at": submitted_at, **record}
+                line = json.dumps(record, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+                if position + len(buffer) + len(line) > self.max_segment_bytes and position + len(buffer) > 0:
+                    self._file.write(buffer)
+                    buffer.clear()
+                    self._open_segment(self._segment_index + 1)
+                    position = 0
+                segment, offset = segment_name(self._segment_index), position + len(buffer)
+                locations.append((self._last_id, segment, offset))
+                entries.append((segment, offset, record))
+                buffer += line
+            results.append(locations)
+        self._file.write(buffer)
+        self._sync()
+        return results, entries
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+
+# Выгрузка всех обращений в один файл NDJSON или JSON-массив
+def export(directory, output, fmt="ndjson"):
+    count = 0
+    with open(output, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[\n")
+        for _, _, record in iter_records(directory):
+            line = json.dumps(record, ensure_ascii=False)
+            if fmt == "json":
+                f.write((",\n" if count else "") + line)
+            else:
+                f.write(line + "\n")
+            count += 1
+        if fmt == "json":
+            f.write("\n]\n")
+    return count
+
+
+# Импорт обращений, которые старая версия submit_appeal сохраняла отдельными файлами
+# {last_name}_{first_name}.json. Обращения дописываются в журнал в порядке времени
+# изменения файлов, и это время становится submitted_at. Импортированный файл
+# переименовывается в *.json.imported, поэтому повторный запуск его пропускает
+def import_legacy(log, source="."):
+    appeals = []
+    for name in os.listdir(source):
+        if not name.endswith(LEGACY_SUFFIX):
+            continue
+        path = os.path.join(source, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        # прочие JSON-файлы каталога не трогаем
+        if not isinstance(record, dict) or name != f"{record.get('last_name')}_{record.get('first_name')}{LEGACY_SUFFIX}":
+            continue
+        mtime = os.path.getmtime(path)
+        record.pop("id", None)
+        record.setdefault("submitted_at", datetime.fromtimestamp(mtime).isoformat(timespec="seconds"))
+        appeals.append((mtime, path, record))
+    appeals.sort(key=lambda appeal: (appeal[0], appeal[1]))
+    if appeals:
+        log.submit([record for _, _, record in appeals]).result()
+        for _, path, _ in appeals:
+            os.rename(path, path + IMPORTED_SUFFIX)
+    return len(appeals)
+
+
+# Компактификация: переписывает журнал в сегменты полного размера, отбрасывая
+# испорченные строки. Выполняется при остановленном сервере
+def compact(directory, max_segment_bytes=DEFAULT_SEGMENT_BYTES):
+    directory = os.path.abspath(directory)
+    target = directory + ".compact"
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+    index, size, count = 1, 0, 0
+    out = open(os.path.join(target, segment_name(index)), "wb")
+    try:
+        for _, _, record in iter_records(directory):
+            line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+            if size and size + len(line) > max_segment_bytes:
+                out.flush()
+                os.fsync(out.fileno())
+                out.close()
+                index += 1
+                size = 0
+                out = open(os.path.join(target, segment_name(index)), "wb")
+            out.write(line)
+            size += len(line)
+            count += 1
+        out.flush()
+        os.fsync(out.fileno())
+    finally:
+        out.close()
+    backup = directory + ".old"
+    os.rename(directory, backup)
+    os.rename(target, directory)
+    shutil.rmtree(backup)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Appeal log maintenance")
+    parser.add_argument("--dir", default="appeals", help="appeal log directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="export all appeals to one file")
+    export_parser.add_argument("output")
+    export_parser.add_argument("--format", choices=["ndjson", "json"], default="ndjson")
+    compact_parser = commands.add_parser("compact", help="rewrite the log into full-size segments")
+    compact_parser.add_argument("--max-segment-mb", type=int, default=DEFAULT_SEGMENT_BYTES // (1024 * 1024))
+    reindex_parser = commands.add_parser("reindex", help="import legacy appeal files and rebuild the SQLite index")
+    reindex_parser.add_argument("--legacy-dir", default=".",
+                                help="directory with {last_name}_{first_name}.json files of the old submit_appeal")
+    parser.add_argument("--index", default="appeals.db", help="SQLite index file")
+    args = parser.parse_args()
+
+    from appeal_index import AppealIndex
+
+    if args.command == "export":
+        print(f"Exported {export(args.dir, args.output, args.format)} appeals")
+    elif args.command == "compact":
+        print(f"Compacted {compact(args.dir, args.max_segment_mb * 1024 * 1024)} appeals")
+        # сегменты и смещения записей изменились - индекс нужно перестроить
+        print(f"Reindexed {AppealIndex(args.index).rebuild(args.dir)} appeals")
+    else:
+        # индекс перестраивается целиком ниже, поэтому журнал пишется без on_commit
+        log = AppealLog(args.dir)
+        try:
+            print(f"Imported {import_legacy(log, args.legacy_dir)} legacy appeals")
+        finally:
+            log.close()
+        print(f"Reindexed {AppealIndex(args.index).rebuild(args.dir)} appeals")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,36 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, EmailStr, validator
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, validator, TypeAdapter, StringConstraints, ValidationError
+from typing_extensions import TypedDict
+from contextlib import asynccontextmanager
 from datetime import date
+from typing import Annotated, Optional
+import asyncio
 import json
 import os
+from appeal_store import AppealLog
+from appeal_index import AppealIndex
 
-app = FastAPI()
+APPEALS_DIR = os.getenv("APPEALS_DIR", "appeals")
+APPEALS_INDEX = os.getenv("APPEALS_INDEX", "appeals.db")
+APPEALS_BATCH_SIZE = 1000
+
+# Обращения дописываются в сегментированный журнал (см. appeal_store.py),
+# а поиск идет по индексу в SQLite, который обновляется после каждой записи журнала
+appeal_index = AppealIndex(APPEALS_INDEX)
+appeal_log = AppealLog(APPEALS_DIR, on_commit=appeal_index.add)
+
+@asynccontextmanager
+async def lifespan(app):
+    # под блокировкой журнала: другие воркеры в это время не пишут и не индексируют
+    with appeal_log.locked():
+        appeal_index.catch_up(APPEALS_DIR)
+    appeal_log.open()
+    yield
+    # дожидаемся записи и fsync всех принятых обращений
+    appeal_log.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Модель Pydantic для валидации данных
 class Appeal(BaseModel):
@@ -35,18 +61,124 @@ class Appeal(BaseModel):
             raise ValueError('Номер телефона должен начинаться с "+" и содержать только цифры')
         return v
 
+# Те же правила, что и у Appeal, для пакетной проверки: регулярные выражения
+# компилируются один раз в pydantic-core, и пакет проверяется одним вызовом
+Name = Annotated[str, StringConstraints(pattern=r"^[\p{Lu}\p{Lt}]\p{Ll}*$")]
+PhoneNumber = Annotated[str, StringConstraints(pattern=r"^\+[0-9]+$")]
+
+class AppealRecord(TypedDict):
+    last_name: Name
+    first_name: Name
+    birth_date: date
+    phone_number: PhoneNumber
+    email: EmailStr
+
+appeal_batch_adapter = TypeAdapter(list[AppealRecord])
+
+PATTERN_MESSAGES = {
+    "last_name": "Фамилия должна начинаться с заглавной буквы и содержать только кириллицу",
+    "first_name": "Имя должно начинаться с заглавной буквы и содержать только кириллицу",
+    "phone_number": 'Номер телефона должен начинаться с "+" и содержать только цифры',
+}
+
+def format_error(error):
+    # loc = (индекс в пакете, поле); у ошибки всей записи поля нет
+    field = error["loc"][1] if len(error["loc"]) > 1 else None
+    if error["type"] == "string_pattern_mismatch" and field in PATTERN_MESSAGES:
+        return {"field": field, "message": PATTERN_MESSAGES[field]}
+    return {"field": field, "message": error["msg"]}
+
+# Проверяет пакет словарей; возвращает проверенные записи и ошибки по индексам пакета.
+# При ошибках правильные записи проверяются повторно уже без ошибочных
+def validate_appeals(items):
+    try:
+        return appeal_batch_adapter.validate_python(items), {}
+    except ValidationError as e:
+        errors = {}
+        for error in e.errors(include_url=False):
+            errors.setdefault(error["loc"][0], []).append(format_error(error))
+    valid_items = [item for index, item in enumerate(items) if index not in errors]
+    return appeal_batch_adapter.validate_python(valid_items), errors
+
 # Эндпоинт для приема данных
 @app.post("/submit_appeal/")
 async def submit_appeal(appeal: Appeal):
     # Преобразуем данные в словарь
     appeal_data = appeal.dict()
     
-    # Сохраняем данные в JSON-файл
-    file_name = f"{appeal.last_name}_{appeal.first_name}.json"
-    with open(file_name, 'w', encoding='utf-8') as f:
-        json.dump(appeal_data, f, ensure_ascii=False, indent=4)
+    # Дописываем обращение в журнал; запись и fsync выполняются в потоке журнала
+    [(appeal_id, segment, _)] = await appeal_log.append([appeal_data])
     
-    return {"message": "Обращение успешно сохранено", "file_name": file_name}
+    return {"message": "Обращение успешно сохранено", "id": appeal_id, "segment": segment}
+
+# Пакетный прием обращений в формате NDJSON (одно обращение в строке). Строки читаются
+# из потока и проверяются пакетами по APPEALS_BATCH_SIZE; правильные обращения каждого
+# пакета дописываются в журнал одной записью, ошибки возвращаются по номерам строк.
+# Разбор и проверка пакета выполняются в пуле потоков, а не в цикле событий
+@app.post("/submit_appeals/")
+async def submit_appeals(request: Request):
+    errors = []
+    pending = []
+    lines = []
+    line_number = 0
+
+    def flush(batch):
+        items = []
+        item_lines = []
+        for number, line in batch:
+            try:
+                items.append(json.loads(line))
+                item_lines.append(number)
+            except ValueError as e:
+                errors.append({"line": number, "errors": [{"field": None, "message": f"Invalid JSON: {e}"}]})
+        if not items:
+            return
+        records, batch_errors = validate_appeals(items)
+        for index, item_errors in batch_errors.items():
+            errors.append({"line": item_lines[index], "errors": item_errors})
+        valid_lines = [number for index, number in enumerate(item_lines) if index not in batch_errors]
+        if records:
+            pending.append((valid_lines, appeal_log.submit(records)))
+
+    buffer = b""
+    async for chunk in request.stream():
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            line_number += 1
+            if line.strip():
+                lines.append((line_number, line))
+            # пакет ограничен и тогда, когда все тело пришло одним куском
+            if len(lines) >= APPEALS_BATCH_SIZE:
+                batch, lines = lines, []
+                await run_in_threadpool(flush, batch)
+    if buffer.strip():
+        lines.append((line_number + 1, buffer))
+    await run_in_threadpool(flush, lines)
+
+    appeals = []
+    for valid_lines, future in pending:
+        locations = await asyncio.wrap_future(future)
+        appeals.extend({"line": number, "id": appeal_id} for number, (appeal_id, _, _) in zip(valid_lines, locations))
+    errors.sort(key=lambda error: error["line"])
+    return {"accepted": len(appeals), "rejected": len(errors), "appeals": appeals, "errors": errors}
+
+# Поиск обращений по индексу; from и to ограничивают дату рождения
+@app.get("/appeals")
+def list_appeals(
+    email: Optional[str] = None,
+    last_name: Optional[str] = None,
+    first_name: Optional[str] = None,
+    phone_number: Optional[str] = None,
+    birth_date_from: Optional[date] = Query(None, alias="from"),
+    birth_date_to: Optional[date] = Query(None, alias="to"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    return appeal_index.search(
+        email=email, last_name=last_name, first_name=first_name, phone_number=phone_number,
+        birth_date_from=birth_date_from, birth_date_to=birth_date_to, skip=skip, limit=limit,
+    )
 
 # Запуск сервера
 if __name__ == "__main__":
@@ -0,0 +1,131 @@
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime
+import appeal_store
+from appeal_index import AppealIndex
+from appeal_store import AppealLog, compact, list_segments
+
+def make_appeal(index):
+    return {
+        "last_name": "Иванов",
+        "first_name": f"Имя{index}",
+        "birth_date": f"2000-01-{index % 28 + 1:02d}",
+        "phone_number": f"+7900000{index:04d}",
+        "email": f"user{index}@example.com",
+    }
+
+def read_at(directory, segment, offset):
+    with open(os.path.join(directory, segment), "rb") as f:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+def assert_index_matches_log(index, directory):
+    # каждая строка индекса указывает на запись журнала с тем же id
+    rows = index._connect().execute("SELECT id, segment, byte_offset FROM appeals ORDER BY id").fetchall()
+    for row in rows:
+        assert read_at(directory, row["segment"], row["byte_offset"])["id"] == row["id"]
+    return [row["id"] for row in rows]
+
+def test_index_follows_log():
+    """Тест обновления индекса после записи журнала"""
+    workdir = tempfile.mkdtemp()
+    directory = os.path.join(workdir, "appeals")
+    index = AppealIndex(os.path.join(workdir, "appeals.db"))
+    log = AppealLog(directory, max_segment_bytes=1000, fsync=False, on_commit=index.add)
+    for number in range(20):
+        log.submit([make_appeal(number)]).result()
+    log.close()
+
+    assert len(list_segments(directory)) > 1
+    assert assert_index_matches_log(index, directory) == list(range(1, 21))
+    assert [row["email"] for row in index.search(email="user5@example.com")] == ["user5@example.com"]
+    assert len(index.search(last_name="Иванов", limit=1000)) == 20
+
+def test_index_catch_up():
+    """Тест догоняющей индексации записей, не попавших в индекс"""
+    workdir = tempfile.mkdtemp()
+    directory = os.path.join(workdir, "appeals")
+    index = AppealIndex(os.path.join(workdir, "appeals.db"))
+    log = AppealLog(directory, max_segment_bytes=1000, fsync=False, on_commit=index.add)
+    log.submit([make_appeal(number) for number in range(5)]).result()
+    log.close()
+    # сбой между fsync журнала и записью индекса
+    log = AppealLog(directory, max_segment_bytes=1000, fsync=False)
+    log.submit([make_appeal(number) for number in range(5, 15)]).result()
+    log.close()
+
+    index.catch_up(directory)
+    assert assert_index_matches_log(index, directory) == list(range(1, 16))
+
+def test_index_rebuild_after_compaction():
+    """Тест перестройки индекса после компактификации журнала"""
+    workdir = tempfile.mkdtemp()
+    directory = os.path.join(workdir, "appeals")
+    index = AppealIndex(os.path.join(workdir, "appeals.db"))
+    log = AppealLog(directory, max_segment_bytes=1000, fsync=False, on_commit=index.add)
+    for number in range(30):
+        log.submit([make_appeal(number)]).result()
+    log.close()
+    segments_before = list_segments(directory)
+
+    # испорченная строка в середине журнала
+    with open(os.path.join(directory, segments_before[0]), "ab") as f:
+        f.write(b"not json\n")
+
+    assert compact(directory, max_segment_bytes=4000) == 30
+    assert len(list_segments(directory)) < len(segments_before)
+
+    # старые сегменты и смещения индекса больше не соответствуют журналу
+    assert index.rebuild(directory) == 30
+    assert assert_index_matches_log(index, directory) == list(range(1, 31))
+    assert index.search(email="user29@example.com")[0]["id"] == 30
+
+    # новые записи после компактификации продолжают нумерацию
+    log = AppealLog(directory, max_segment_bytes=4000, fsync=False, on_commit=index.add)
+    [(appeal_id, _, _)] = log.submit([make_appeal(30)]).result()
+    log.close()
+    assert appeal_id == 31
+    assert assert_index_matches_log(index, directory) == list(range(1, 32))
+
+def test_reindex_imports_legacy_files(monkeypatch):
+    """Тест импорта файлов старой версии submit_appeal при перестройке индекса"""
+    workdir = tempfile.mkdtemp()
+    directory = os.path.join(workdir, "appeals")
+    index_path = os.path.join(workdir, "appeals.db")
+    legacy_dir = os.path.join(workdir, "legacy")
+    os.makedirs(legacy_dir)
+    log = AppealLog(directory, fsync=False)
+    log.submit([make_appeal(number) for number in range(3)]).result()
+    log.close()
+
+    # файлы в формате {last_name}_{first_name}.json; порядок импорта - по времени изменения
+    for number, mtime in ((10, 2000000000), (11, 1000000000)):
+        appeal = make_appeal(number)
+        path = os.path.join(legacy_dir, f"{appeal['last_name']}_{appeal['first_name']}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(appeal, f, ensure_ascii=False, indent=4)
+        os.utime(path, (mtime, mtime))
+    # посторонние и испорченные JSON-файлы не импортируются
+    with open(os.path.join(legacy_dir, "settings.json"), "w") as f:
+        json.dump({"debug": True}, f)
+    with open(os.path.join(legacy_dir, "Петров_Петр.json"), "w") as f:
+        f.write("{broken")
+
+    argv = ["appeal_store.py", "--dir", directory, "--index", index_path, "reindex", "--legacy-dir", legacy_dir]
+    monkeypatch.setattr(sys, "argv", argv)
+    appeal_store.main()
+
+    index = AppealIndex(index_path)
+    assert assert_index_matches_log(index, directory) == [1, 2, 3, 4, 5]
+    assert [row["email"] for row in index.search(last_name="Иванов", limit=10)][3:] == [
+        "user11@example.com", "user10@example.com"]
+    assert index.search(email="user10@example.com")[0]["submitted_at"] == \
+        datetime.fromtimestamp(2000000000).isoformat(timespec="seconds")
+    assert sorted(os.listdir(legacy_dir)) == [
+        "settings.json", "Иванов_Имя10.json.imported", "Иванов_Имя11.json.imported", "Петров_Петр.json"]
+
+    # повторная перестройка не импортирует файлы второй раз
+    appeal_store.main()
+    assert assert_index_matches_log(index, directory) == [1, 2, 3, 4, 5]
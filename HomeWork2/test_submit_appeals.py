@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+
+# Журнал и индекс обращений во временном каталоге; пути читаются при импорте main
+workdir = tempfile.mkdtemp()
+os.environ["APPEALS_DIR"] = os.path.join(workdir, "appeals")
+os.environ["APPEALS_INDEX"] = os.path.join(workdir, "appeals.db")
+
+import main
+from fastapi.testclient import TestClient
+
+def make_appeal(**fields):
+    appeal = {
+        "last_name": "Иванов",
+        "first_name": "Иван",
+        "birth_date": "2000-01-01",
+        "phone_number": "+79000000000",
+        "email": "ivanov@example.com",
+    }
+    appeal.update(fields)
+    return appeal
+
+def ndjson(*lines):
+    return "\n".join(line if isinstance(line, str) else json.dumps(line, ensure_ascii=False) for line in lines)
+
+def test_submit_appeals_reports_errors_by_line():
+    """Тест пакетного приема с ошибками в отдельных строках"""
+    body = ndjson(
+        make_appeal(email="first@example.com"),
+        make_appeal(last_name="иванов"),
+        "{broken json",
+        "",
+        make_appeal(phone_number="89000000000", email="not-an-email"),
+        make_appeal(email="last@example.com"),
+    )
+    with TestClient(main.app) as client:
+        response = client.post("/submit_appeals/", content=body.encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+    assert response.status_code == 200
+    data = response.json()
+
+    # правильные строки приняты, пустая строка пропущена, ошибки - по номерам строк
+    assert data["accepted"] == 2
+    assert data["rejected"] == 3
+    assert [appeal["line"] for appeal in data["appeals"]] == [1, 6]
+    assert [error["line"] for error in data["errors"]] == [2, 3, 5]
+    errors = {error["line"]: error["errors"] for error in data["errors"]}
+    assert errors[2] == [{"field": "last_name", "message": main.PATTERN_MESSAGES["last_name"]}]
+    assert errors[3][0]["field"] is None and errors[3][0]["message"].startswith("Invalid JSON")
+    assert sorted(error["field"] for error in errors[5]) == ["email", "phone_number"]
+
+    # принятые обращения получили id журнала и находятся через индекс
+    first_id, last_id = (appeal["id"] for appeal in data["appeals"])
+    assert last_id > first_id
+    with TestClient(main.app) as client:
+        found = client.get("/appeals", params={"email": "last@example.com"}).json()
+    assert [appeal["id"] for appeal in found] == [last_id]
+
+def test_submit_appeals_across_batches(monkeypatch):
+    """Тест нумерации строк, когда поток проверяется несколькими пакетами"""
+    monkeypatch.setattr(main, "APPEALS_BATCH_SIZE", 3)
+    batch_sizes = []
+    validate_appeals = main.validate_appeals
+    def counting_validate(items):
+        batch_sizes.append(len(items))
+        return validate_appeals(items)
+    monkeypatch.setattr(main, "validate_appeals", counting_validate)
+    lines = [make_appeal(email=f"batch{number}@example.com") for number in range(7)]
+    lines[4] = make_appeal(first_name="Иван1", email="batch4@example.com")
+    with TestClient(main.app) as client:
+        response = client.post("/submit_appeals/", content=ndjson(*lines).encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"}
+        )
+    data = response.json()
+    assert batch_sizes == [3, 3, 1]
+    assert data["accepted"] == 6
+    assert [appeal["line"] for appeal in data["appeals"]] == [1, 2, 3, 4, 6, 7]
+    assert [error["line"] for error in data["errors"]] == [5]
+    ids = [appeal["id"] for appeal in data["appeals"]]
+    assert ids == sorted(ids)
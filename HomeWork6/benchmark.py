@@ -0,0 +1,269 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import sqlalchemy
+
+from main import DatabaseManager, Student
+
+# Бенчмарк DatabaseManager на синтетических данных разного размера.
+# Результаты сохраняются в JSON, два файла можно сравнить между коммитами:
+#   python benchmark.py --sizes 10000 100000 --output before.json
+#   python benchmark.py --sizes 10000 100000 --output after.json
+#   python benchmark.py --compare before.json after.json
+# Холодный старт (импорт модуля и первый ответ нового процесса):
+#   python benchmark.py --cold-start
+
+SURNAMES = [
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+    "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров",
+    "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин",
+    "Захаров", "Зайцев", "Соловьев", "Борисов", "Яковлев", "Григорьев", "Романов", "Воробьев",
+]
+MALE_NAMES = [
+    "Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артем", "Илья",
+    "Кирилл", "Михаил", "Никита", "Матвей", "Роман", "Егор", "Арсений", "Иван",
+]
+FEMALE_NAMES = [
+    "Анастасия", "Мария", "Анна", "Виктория", "Екатерина", "Наталья", "Марина", "Полина",
+    "София", "Дарья", "Алиса", "Ксения", "Елена", "Ольга", "Татьяна", "Юлия",
+]
+FACULTIES = ["ФТФ", "ФПМИ", "ФИВТ", "ФРКТ", "ФАКИ", "ФЭФМ", "ФМБФ", "ФБМФ", "ИНБИКСТ", "ФПФЭ"]
+SUBJECTS = [
+    "Математический анализ", "Линейная алгебра", "Теор. Механика", "Общая физика",
+    "Дифференциальные уравнения", "Теория вероятностей", "Информатика", "Химия",
+    "Английский язык", "Философия", "Электродинамика", "Квантовая механика",
+]
+
+CSV_HEADER = ["Фамилия", "Имя", "Факультет", "Курс", "Оценка"]
+
+# Целевое время от запуска интерпретатора до первого ответа приложения
+COLD_START_TARGET = 1.5
+
+# Выполняется в отдельном процессе: время импорта main и время до первого ответа
+# (lifespan открывает БД с миграцией схемы и клиент Redis)
+COLD_START_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {directory!r})
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+app = main.create_app(main.Settings(database_url={database_url!r}, auto_migrate=True))
+with TestClient(app) as client:
+    client.get("/metrics")
+    ready = time.perf_counter()
+print(imported - start, ready - start)
+"""
+
+
+# Детерминированный генератор students.csv: одинаковые seed и rows дают один и тот же файл.
+# Фамилии согласуются с полом, у факультетов и курсов неравномерные веса,
+# оценки распределены нормально вокруг 65 и обрезаны до 0..100
+def generate_students_csv(path, rows, seed=42):
+    rng = random.Random(seed)
+    faculty_weights = [rng.uniform(0.5, 3) for _ in FACULTIES]
+    subject_weights = [rng.uniform(0.5, 3) for _ in SUBJECTS]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for _ in range(rows):
+            surname = rng.choice(SURNAMES)
+            if rng.random() < 0.5:
+                name = rng.choice(MALE_NAMES)
+            else:
+                name = rng.choice(FEMALE_NAMES)
+                surname += "а"
+            writer.writerow([
+                surname,
+                name,
+                rng.choices(FACULTIES, faculty_weights)[0],
+                rng.choices(SUBJECTS, subject_weights)[0],
+                min(100, max(0, round(rng.gauss(65, 20)))),
+            ])
+
+
+def summarize(durations):
+    return {
+        "runs": len(durations),
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.fmean(durations),
+        "max": max(durations),
+    }
+
+
+def time_operation(manager, repeats, operation):
+    durations = []
+    for i in range(repeats):
+        with manager.SessionLocal() as db:
+            start = time.perf_counter()
+            operation(db, i)
+            durations.append(time.perf_counter() - start)
+    return summarize(durations)
+
+
+def benchmark_size(rows, workdir, seed, repeats):
+    csv_path = os.path.join(workdir, f"students_{rows}.csv")
+    db_path = os.path.join(workdir, f"students_{rows}.db")
+    if not os.path.exists(csv_path):
+        generate_students_csv(csv_path, rows, seed)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    manager = DatabaseManager(f"sqlite:///{db_path}")
+    manager.migrate()
+    results = {}
+
+    # на всех размерах данные загружает штатный импорт: его время тоже результат замера
+    start = time.perf_counter()
+    with manager.SessionLocal() as db:
+        manager.fill_from_csv(db, csv_path)
+    results["fill_from_csv"] = summarize([time.perf_counter() - start])
+
+    with manager.SessionLocal() as db:
+        student_count = db.query(Student).count()
+        max_id = db.query(sqlalchemy.func.max(Student.id)).scalar() or 0
+
+    rng = random.Random(seed)
+    results["get_students_by_faculty"] = time_operation(
+        manager, repeats,
+        lambda db, i: manager.get_students_by_faculty(db, FACULTIES[i % len(FACULTIES)]))
+    results["get_average_score_by_faculty"] = time_operation(
+        manager, repeats,
+        lambda db, i: manager.get_average_score_by_faculty(db, FACULTIES[i % len(FACULTIES)]))
+    results["get_low_score_students_by_subject"] = time_operation(
+        manager, repeats,
+        lambda db, i: manager.get_low_score_students_by_subject(db, SUBJECTS[i % len(SUBJECTS)]))
+    results["update_student"] = time_operation(
+        manager, repeats,
+        lambda db, i: manager.update_student(db, rng.randint(1, max_id), {"score": rng.randint(0, 100)}))
+    results["delete_students"] = time_operation(
+        manager, repeats,
+        lambda db, i: manager.delete_students(db, rng.sample(range(1, max_id + 1), min(100, max_id))))
+
+    manager.engine.dispose()
+    return {"rows": rows, "students": student_count, "operations": results}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True, stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="students-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "sqlite": __import__("sqlite3").sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeats": args.repeats,
+        },
+        "results": {},
+    }
+    for rows in args.sizes:
+        print(f"Benchmarking {rows} rows...", file=sys.stderr)
+        report["results"][str(rows)] = benchmark_size(rows, workdir, args.seed, args.repeats)
+        for operation, stats in report["results"][str(rows)]["operations"].items():
+            print(f"  {operation:<36} median {stats['median'] * 1000:10.2f} ms", file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+def cold_start(repeats, workdir):
+    workdir = workdir or tempfile.mkdtemp(prefix="students-cold-")
+    os.makedirs(workdir, exist_ok=True)
+    script = COLD_START_SCRIPT.format(
+        directory=os.path.dirname(os.path.abspath(__file__)),
+        database_url=f"sqlite:///{os.path.join(workdir, 'cold_start.db')}",
+    )
+    imports, first_responses, processes = [], [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=workdir, text=True,
+                                         stderr=subprocess.DEVNULL)
+        processes.append(time.perf_counter() - start)
+        imported, ready = map(float, output.split()[-2:])
+        imports.append(imported)
+        first_responses.append(ready)
+    results = {
+        "import_main": summarize(imports),
+        "first_response": summarize(first_responses),
+        "process": summarize(processes),
+        "target": COLD_START_TARGET,
+    }
+    for name in ("import_main", "first_response", "process"):
+        print(f"  {name:<16} median {results[name]['median'] * 1000:10.2f} ms", file=sys.stderr)
+    verdict = "OK" if results["process"]["median"] <= COLD_START_TARGET else "SLOWER THAN TARGET"
+    print(f"  target {COLD_START_TARGET * 1000:.0f} ms: {verdict}", file=sys.stderr)
+    return results
+
+
+# Сравнение медиан двух прогонов: отношение > 1 означает замедление
+def compare(base_path, new_path):
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"base {base['meta'].get('commit')} -> new {new['meta'].get('commit')}")
+    print(f"{'rows':>10}  {'operation':<36} {'base ms':>10} {'new ms':>10} {'ratio':>7}")
+    for rows, new_result in new["results"].items():
+        base_result = base["results"].get(rows)
+        if base_result is None:
+            continue
+        for operation, stats in new_result["operations"].items():
+            base_stats = base_result["operations"].get(operation)
+            if base_stats is None:
+                continue
+            ratio = stats["median"] / base_stats["median"] if base_stats["median"] else float("inf")
+            print(f"{rows:>10}  {operation:<36} {base_stats['median'] * 1000:10.2f} "
+                  f"{stats['median'] * 1000:10.2f} {ratio:7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DatabaseManager benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000],
+                        help="number of rows, e.g. 10000 100000 1000000 10000000")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", help="directory for generated CSV and database files")
+    parser.add_argument("--output", help="write JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"))
+    parser.add_argument("--cold-start", action="store_true", help="measure process cold start instead")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+    elif args.cold_start:
+        print(json.dumps(cold_start(args.repeats, args.workdir), indent=2))
+    else:
+        run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import asyncio
+import math
+import re
+import time
+from collections import deque
+
+# Адаптивное ограничение параллельности по классам маршрутов (AIMD). Пока запросы
+# класса укладываются в целевую латентность, лимит растет на 1 за "окно" из limit
+# запросов; медленный ответ или 5xx уменьшают лимит в backoff раз, но не чаще раза
+# за target секунд. Сверх лимита запросы ждут в короткой очереди, а при ее
+# переполнении или по таймауту сразу получают 503 с Retry-After
+
+
+class AIMDLimiter:
+    def __init__(self, name, initial_limit, min_limit, max_limit, target, max_queue,
+                 queue_timeout=None, backoff=0.9, metrics=None):
+        self.name = name
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout if queue_timeout is not None else 2 * target
+        self.backoff = backoff
+        self.metrics = metrics
+        self.in_flight = 0
+        self._waiters = deque()
+        self._last_decrease = 0.0
+        self._update_metrics()
+
+    def _has_capacity(self):
+        return self.in_flight < math.floor(self.limit)
+
+    # True - запрос можно выполнять, False - его нужно отклонить
+    async def acquire(self):
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            self._update_metrics()
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self._reject()
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_metrics()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not (waiter.done() and not waiter.cancelled()):
+                self._waiters.remove(waiter)
+                self._update_metrics()
+                self._reject()
+                return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # место уже выдано - возвращаем его следующему
+                self.release(0.0, True)
+            else:
+                self._waiters.remove(waiter)
+                self._update_metrics()
+            raise
+        return True
+
+    def release(self, latency, ok):
+        self.in_flight -= 1
+        now = time.monotonic()
+        if not ok or latency > self.target:
+            if now - self._last_decrease >= self.target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        # место передается ожидающему: in_flight увеличивается за него
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+        self._update_metrics()
+
+    def _reject(self):
+        if self.metrics is not None:
+            self.metrics["rejected"].inc((self.name,))
+
+    def _update_metrics(self):
+        if self.metrics is not None:
+            self.metrics["limit"].set(self.limit, (self.name,))
+            self.metrics["in_flight"].set(self.in_flight, (self.name,))
+            self.metrics["queue"].set(len(self._waiters), (self.name,))
+
+    # Через сколько секунд имеет смысл повторить запрос
+    def retry_after(self):
+        return max(1, math.ceil(self.target * (len(self._waiters) + 1) / max(1, self.limit)))
+
+
+# ASGI middleware. classes - список (метод или None, регулярное выражение пути, лимитер);
+# запросы, не попавшие ни в один класс, не ограничиваются
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app, classes):
+        self.app = app
+        self.classes = [(method, re.compile(pattern), limiter) for method, pattern, limiter in classes]
+
+    def _classify(self, scope):
+        for method, pattern, limiter in self.classes:
+            if (method is None or method == scope["method"]) and pattern.fullmatch(scope["path"]):
+                return limiter
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limiter = self._classify(scope)
+        if limiter is None:
+            return await self.app(scope, receive, send)
+
+        if not await limiter.acquire():
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"retry-after", str(limiter.retry_after()).encode()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b'{"detail":"Service overloaded, retry later"}'})
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(time.perf_counter() - start, status_code < 500)
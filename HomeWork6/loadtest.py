@@ -0,0 +1,301 @@
+import argparse
+import asyncio
+import fnmatch
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+# Нагрузочный тест HTTP-маршрутов с конкурентными виртуальными пользователями.
+# По умолчанию приложение запускается в этом же процессе через ASGI (с локальной
+# заменой Redis и временной базой), поэтому тест работает без сети:
+#   python loadtest.py --users 1 4 16 64 --duration 10
+# Можно нагружать и запущенный uvicorn:
+#   python loadtest.py --url http://127.0.0.1:8000 --users 8 --duration 30
+
+# Доли видов трафика по умолчанию
+DEFAULT_MIX = {
+    "login": 1,
+    "list": 5,
+    "faculty": 3,
+    "subject": 3,
+    "create": 1,
+    "delete": 1,
+}
+
+
+# Замена Redis в памяти процесса: только команды, которые использует приложение
+class LocalRedis:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key):
+        value = self._data.get(key)
+        if value is not None and value[1] is not None and value[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            value = self._alive(key)
+            return value[0] if value else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (str(value).encode() if not isinstance(value, bytes) else value, None)
+        return True
+
+    def setex(self, key, expire, value):
+        with self._lock:
+            data = value.encode() if isinstance(value, str) else value
+            self._data[key] = (data, time.monotonic() + expire)
+        return True
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = self._alive(key)
+            number = int(value[0]) + amount if value else amount
+            self._data[key] = (str(number).encode(), value[1] if value else None)
+            return number
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def keys(self, pattern="*"):
+        with self._lock:
+            return [key.encode() for key in list(self._data) if fnmatch.fnmatch(key, pattern) and self._alive(key)]
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+        return True
+
+    def ping(self):
+        return True
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, action, latency, ok):
+        self.latencies[action].append(latency)
+        if not ok:
+            self.errors[action] += 1
+
+    def summary(self, elapsed):
+        actions = {}
+        total = 0
+        total_errors = 0
+        all_latencies = []
+        for action, latencies in sorted(self.latencies.items()):
+            latencies.sort()
+            total += len(latencies)
+            total_errors += self.errors[action]
+            all_latencies.extend(latencies)
+            actions[action] = self._describe(latencies, self.errors[action], elapsed)
+        all_latencies.sort()
+        overall = self._describe(all_latencies, total_errors, elapsed)
+        return {"overall": overall, "actions": actions}
+
+    @staticmethod
+    def _describe(latencies, errors, elapsed):
+        count = len(latencies)
+        return {
+            "requests": count,
+            "throughput_rps": count / elapsed if elapsed else 0,
+            "error_rate": errors / count if count else 0,
+            "p50_ms": (percentile(latencies, 50) or 0) * 1000,
+            "p90_ms": (percentile(latencies, 90) or 0) * 1000,
+            "p99_ms": (percentile(latencies, 99) or 0) * 1000,
+            "max_ms": (latencies[-1] if latencies else 0) * 1000,
+        }
+
+
+class VirtualUser:
+    def __init__(self, client, index, stats, mix, faculties, subjects, rng):
+        self.client = client
+        self.username = f"loaduser_{os.getpid()}_{index}_{rng.randrange(10**9)}"
+        self.password = "loadpass"
+        self.stats = stats
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.faculties = faculties
+        self.subjects = subjects
+        self.rng = rng
+        self.headers = {}
+        self.created_ids = []
+
+    async def request(self, action, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            ok = response.status_code < 400 or (action == "delete" and response.status_code == 404)
+        except httpx.HTTPError:
+            response = None
+            ok = False
+        self.stats.record(action, time.perf_counter() - start, ok)
+        return response
+
+    async def setup(self):
+        await self.client.post("/auth/register", json={
+            "username": self.username,
+            "email": f"{self.username}@example.com",
+            "password": self.password,
+        })
+        await self.login()
+
+    async def login(self):
+        response = await self.request("login", "POST", "/auth/token",
+                                      data={"username": self.username, "password": self.password})
+        if response is not None and response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def step(self):
+        action = self.rng.choices(self.actions, self.weights)[0]
+        if action == "login":
+            await self.login()
+        elif action == "list":
+            await self.request(action, "GET", "/students/", headers=self.headers)
+        elif action == "faculty":
+            faculty = self.rng.choice(self.faculties)
+            await self.request(action, "GET", f"/students/faculty/{faculty}", headers=self.headers)
+        elif action == "subject":
+            subject = self.rng.choice(self.subjects)
+            await self.request(action, "GET", f"/students/low_score/{subject}", headers=self.headers)
+        elif action == "create":
+            response = await self.request(action, "POST", "/students/", headers=self.headers, json={
+                "surname": "Нагрузкин",
+                "name": "Тест",
+                "faculty": self.rng.choice(self.faculties),
+                "subject": self.rng.choice(self.subjects),
+                "score": self.rng.randint(0, 100),
+            })
+            if response is not None and response.status_code == 200:
+                self.created_ids.append(response.json()["id"])
+        elif action == "delete" and self.created_ids:
+            student_id = self.created_ids.pop()
+            await self.request(action, "DELETE", f"/students/{student_id}", headers=self.headers)
+
+    async def run(self, deadline):
+        while time.perf_counter() < deadline:
+            await self.step()
+
+
+async def run_step(make_client, users, duration, mix, faculties, subjects, seed):
+    stats = Stats()
+    async with make_client() as client:
+        virtual_users = [
+            VirtualUser(client, i, stats, mix, faculties, subjects, random.Random(seed + i))
+            for i in range(users)
+        ]
+        await asyncio.gather(*(user.setup() for user in virtual_users))
+        stats.latencies.clear()
+        stats.errors.clear()
+        start = time.perf_counter()
+        await asyncio.gather(*(user.run(start + duration) for user in virtual_users))
+        elapsed = time.perf_counter() - start
+    return stats.summary(elapsed)
+
+
+# Точка насыщения: первая ступень, на которой рост числа пользователей почти не
+# увеличил пропускную способность (< 10%), а p99 заметно вырос (> 1.5 раза)
+def find_saturation(steps):
+    for previous, current in zip(steps, steps[1:]):
+        prev_rps = previous["overall"]["throughput_rps"]
+        rps = current["overall"]["throughput_rps"]
+        if prev_rps and rps < prev_rps * 1.1 and current["overall"]["p99_ms"] > previous["overall"]["p99_ms"] * 1.5:
+            return previous["users"]
+    return None
+
+
+def prepare_in_process_app(rows, seed):
+    workdir = tempfile.mkdtemp(prefix="students-load-")
+    import main
+    from benchmark import generate_students_csv
+
+    app = main.create_app(main.Settings(database_url=f"sqlite:///{os.path.join(workdir, 'students.db')}", auto_migrate=True))
+    resources = app.state.resources
+    resources.redis = LocalRedis()
+    csv_path = os.path.join(workdir, "students.csv")
+    generate_students_csv(csv_path, rows, seed)
+    db_manager = resources.db_manager
+    with db_manager.SessionLocal() as db:
+        db_manager.fill_from_csv(db, csv_path)
+    print(f"In-process app with {rows} students in {workdir}", file=sys.stderr)
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest")
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    if value:
+        for item in value.split(","):
+            action, _, weight = item.partition("=")
+            if action not in DEFAULT_MIX:
+                raise argparse.ArgumentTypeError(f"unknown action: {action}")
+            mix[action] = float(weight)
+    return {action: weight for action, weight in mix.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent HTTP load test for the students API")
+    parser.add_argument("--url", help="base URL of a running server; in-process ASGI app if omitted")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 4, 16],
+                        help="numbers of concurrent virtual users, one step each")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per step")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(""),
+                        help="traffic weights, e.g. login=1,list=5,faculty=3,subject=3,create=1,delete=1")
+    parser.add_argument("--rows", type=int, default=10_000, help="students to seed in-process")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write JSON report to this file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from benchmark import FACULTIES, SUBJECTS
+
+    if args.url:
+        make_client = lambda: httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        make_client = prepare_in_process_app(args.rows, args.seed)
+
+    steps = []
+    for users in args.users:
+        summary = asyncio.run(run_step(make_client, users, args.duration, args.mix, FACULTIES, SUBJECTS, args.seed))
+        summary["users"] = users
+        steps.append(summary)
+        overall = summary["overall"]
+        print(f"{users:>5} users: {overall['throughput_rps']:8.1f} rps  "
+              f"p50 {overall['p50_ms']:8.2f} ms  p99 {overall['p99_ms']:8.2f} ms  "
+              f"errors {overall['error_rate'] * 100:5.2f}%", file=sys.stderr)
+        for action, stats in summary["actions"].items():
+            print(f"       {action:<8} {stats['requests']:>7} req  p50 {stats['p50_ms']:8.2f} ms  "
+                  f"p99 {stats['p99_ms']:8.2f} ms  errors {stats['error_rate'] * 100:5.2f}%", file=sys.stderr)
+
+    saturation = find_saturation(steps)
+    report = {"mix": args.mix, "duration": args.duration, "steps": steps, "saturation_users": saturation}
+    print(f"Saturation point: {saturation if saturation is not None else 'not reached'}", file=sys.stderr)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
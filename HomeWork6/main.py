@@ -1,21 +1,44 @@
 import csv
 from datetime import datetime, timedelta
 from typing import Optional, List
-from fastapi import FastAPI, HTTPException, Depends, status, Request, BackgroundTasks
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, Request, BackgroundTasks, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Integer, String, Float, func
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey, Index, func, text, select, event, table, column
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import sessionmaker, declarative_base, column_property, aliased
 from sqlalchemy.exc import IntegrityError
 import redis
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, PlainTextResponse, StreamingResponse
+from fastapi.encoders import jsonable_encoder
+import hashlib
 import json
+import logging
+import math
 import os
-from functools import wraps
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import wraps, lru_cache
+from starlette.routing import Match
+from metrics import MetricsRegistry
+from profiling import ProfileSigner, ProfileStore, ProfilingMiddleware
+from limiter import AIMDLimiter, ConcurrencyLimitMiddleware
+from stream import ChangeBroadcaster
 
 # Конфигурация
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./students.db")
+# Схему обновляет отдельный шаг "python main.py migrate" до запуска воркеров.
+# AUTO_MIGRATE=1 - обновлять схему при первом обращении воркера к БД (разработка, тесты)
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "0") != "0"
+# Версия схемы в PRAGMA user_version; увеличивается при каждом изменении migrate()
+SCHEMA_VERSION = 1
 SECRET_KEY = "your-secret-key-here"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
@@ -23,9 +46,53 @@ REDIS_HOST = "localhost"
 REDIS_PORT = 6379
 REDIS_DB = 0
 REDIS_CACHE_EXPIRE = 300  # 5 минут
+DATA_VERSION_KEY = "students_data_version"
+USER_CACHE_TTL = 60  # секунд, в течение которых пользователь не перечитывается из БД
+USER_CACHE_SIZE = 10000
+# Строк CSV в одной транзакции импорта; после каждой пачки сохраняется смещение в файле
+CSV_IMPORT_CHUNK = 1000
+# Порог медленного SQL-запроса в мс и число повторов одного запроса за HTTP-запрос,
+# после которого он считается N+1. По умолчанию проверки выключены и слушатели
+# событий движка не регистрируются; включаются, например, SLOW_QUERY_MS=200
+# и REPEATED_QUERY_THRESHOLD=20
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "") or 0) or None
+REPEATED_QUERY_THRESHOLD = int(os.getenv("REPEATED_QUERY_THRESHOLD", "") or 0) or None
+ADMIN_USERNAMES = {"admin"}
+PROFILE_DIR = "profiles"
+PROFILE_MAX_FILES = 50  # старые профили удаляются
+PROFILE_SAMPLE_INTERVAL = 0.001  # секунд между выборками стека
+# Поток изменений /students/stream: период опроса журнала, размер очереди клиента
+# (переполнение - событие resync) и интервал keepalive в секундах
+STREAM_POLL_INTERVAL = 0.5
+STREAM_QUEUE_SIZE = 100
+STREAM_KEEPALIVE = 15.0
+# Классы маршрутов с адаптивным лимитом параллельности: (метод, шаблон пути) и
+# параметры лимитера. Остальные маршруты не ограничиваются
+CONCURRENCY_CLASSES = {
+    "auth": {
+        "routes": [("POST", r"/auth/(token|register)")],
+        "initial_limit": 4, "min_limit": 1, "max_limit": 16, "target": 1.0, "max_queue": 16,
+    },
+    "bulk": {
+        "routes": [("POST", r"/students/(import-from-csv|delete-batch)")],
+        "initial_limit": 2, "min_limit": 1, "max_limit": 4, "target": 1.0, "max_queue": 4,
+    },
+    "reads": {
+        "routes": [("GET", r"/students/"), ("GET", r"/students/(search|faculty/[^/]+)"),
+                   ("GET", r"/subjects/(top|bottom|[^/]+/(top|bottom|range))"),
+                   ("GET", r"/faculty/average_scores"), ("GET", r"/analytics/distribution")],
+        "initial_limit": 20, "min_limit": 2, "max_limit": 100, "target": 0.25, "max_queue": 50,
+    },
+}
 
-# Инициализация Redis
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB)
+# Триггеры на таблице students: полнотекстовый индекс и журнал изменений
+SEARCH_TRIGGERS = ("students_fts_ai", "students_fts_ad", "students_fts_au")
+CHANGE_TRIGGERS = ("student_changes_ai", "student_changes_au", "student_changes_ad")
+CHANGE_TIMESTAMP_SQL = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+# Обновление только этих колонок считается изменением студента
+STUDENT_DATA_COLUMNS = "surname, name, faculty_id, subject_id, score"
+# Ключ session.info с кодами справочников, добавленными в еще не зафиксированной транзакции
+PENDING_CODES_KEY = "pending_codes"
 
 # Базовые модели
 Base = declarative_base()
@@ -40,6 +107,19 @@ class User(Base):
     hashed_password = Column(String)
     is_active = Column(Integer, default=1)
 
+# Справочники факультетов и курсов: в таблице студентов хранятся только целочисленные коды
+class Faculty(Base):
+    __tablename__ = "faculties"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
+class Subject(Base):
+    __tablename__ = "subjects"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
 # Модель студента
 class Student(Base):
     __tablename__ = "students"
@@ -47,13 +127,64 @@ class Student(Base):
     id = Column(Integer, primary_key=True, index=True)
     surname = Column(String, index=True)
     name = Column(String, index=True)
-    faculty = Column(String, index=True)
-    subject = Column(String, index=True)
+    faculty_id = Column(Integer, ForeignKey("faculties.id"), index=True)
+    subject_id = Column(Integer, ForeignKey("subjects.id"), index=True)
     score = Column(Integer)
+    # Отпечаток содержимого строки CSV, из которой импортирован студент; уникальный
+    # индекс не дает повторному импорту создать дубликаты. У студентов, созданных
+    # через API, отпечатка нет
+    fingerprint = Column(String)
+
+    # Названия подгружаются тем же запросом, что и сама строка
+    faculty = column_property(select(Faculty.name).where(Faculty.id == faculty_id).scalar_subquery())
+    subject = column_property(select(Subject.name).where(Subject.id == subject_id).scalar_subquery())
+
+    # Составной индекс для топ-k и диапазонов оценок внутри курса
+    __table_args__ = (
+        Index("ix_students_subject_score", "subject_id", "score"),
+        Index("ux_students_fingerprint", "fingerprint", unique=True),
+    )
 
     def __repr__(self):
         return f"<Student(surname={self.surname}, name={self.name}, faculty={self.faculty}, subject={self.subject}, score={self.score})>"
 
+# Полнотекстовая таблица FTS5 (создается в create_search_index) для соединения в ORM-запросах
+STUDENTS_FTS = table("students_fts", column("rowid"))
+
+# Импорты CSV: файл определяется контрольной суммой содержимого, byte_offset -
+# смещение после последней зафиксированной пачки строк
+class CSVImport(Base):
+    __tablename__ = "csv_imports"
+
+    id = Column(Integer, primary_key=True)
+    checksum = Column(String, unique=True, nullable=False)
+    path = Column(String)
+    size = Column(Integer)
+    byte_offset = Column(Integer, nullable=False, default=0)
+    rows_inserted = Column(Integer, nullable=False, default=0)
+    rows_duplicate = Column(Integer, nullable=False, default=0)
+    rows_invalid = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="running")
+    started_at = Column(String)
+    finished_at = Column(String)
+
+# Журнал изменений студентов. Строки пишут триггеры на таблице students, поэтому
+# в журнал попадает любая запись, включая массовый импорт и удаление. version
+# монотонно растет (AUTOINCREMENT не использует номера повторно)
+class StudentChange(Base):
+    __tablename__ = "student_changes"
+
+    version = Column(Integer, primary_key=True, autoincrement=True)
+    student_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    updated_at = Column(String, nullable=False)
+    # Факультет и курс до изменения (для вставки - новые): по ним подписчики потока
+    # узнают об уходе студента с факультета и об удалении
+    faculty_id = Column(Integer)
+    subject_id = Column(Integer)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
 # Pydantic модели
 class UserBase(BaseModel):
     username: str
@@ -86,48 +217,629 @@ class StudentUpdate(BaseModel):
     subject: str = None
     score: int = None
 
+class StudentResponse(BaseModel):
+    id: int
+    surname: str
+    name: str
+    faculty: str
+    subject: str
+    score: int
+
+    class Config:
+        orm_mode = True
+
+class RankedStudentResponse(StudentResponse):
+    rank: int
+
+class StudentChangeResponse(BaseModel):
+    version: int
+    op: str
+    student_id: int
+    updated_at: str
+    # None для удаленного студента
+    student: Optional[StudentResponse] = None
+
+class StudentChangesResponse(BaseModel):
+    since: int
+    next_since: int
+    has_more: bool
+    changes: List[StudentChangeResponse]
+
 class DeleteStudentsRequest(BaseModel):
     student_ids: List[int]
 
 class CSVImportRequest(BaseModel):
     file_path: str
 
-# Настройки аутентификации
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+class ProfileTokenRequest(BaseModel):
+    path: str
+    ttl: int = 300
+
+# Настройки аутентификации. Контекст bcrypt создается при первой проверке пароля,
+# а не при импорте модуля
+@lru_cache(maxsize=None)
+def get_pwd_context():
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
+# Метрики приложения, отдаются на /metrics в текстовом формате Prometheus
+metrics_registry = MetricsRegistry()
+http_requests_total = metrics_registry.counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status"))
+http_request_duration = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"))
+http_requests_without_db = metrics_registry.counter(
+    "http_requests_without_db_total", "HTTP requests finished without opening a DB session", ("route",))
+db_queries_total = metrics_registry.counter(
+    "db_queries_total", "SQL statements executed", ("route",))
+db_query_seconds_total = metrics_registry.counter(
+    "db_query_duration_seconds_total", "Time spent executing SQL statements", ("route",))
+db_queries_per_request = metrics_registry.histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 1000))
+cache_requests_total = metrics_registry.counter(
+    "cache_requests_total", "Response cache lookups", ("prefix", "result"))
+redis_command_duration = metrics_registry.histogram(
+    "redis_command_duration_seconds", "Redis command latency", ("command",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+limiter_metrics = {
+    "limit": metrics_registry.gauge(
+        "concurrency_limit", "Current adaptive concurrency limit", ("route_class",)),
+    "in_flight": metrics_registry.gauge(
+        "concurrency_in_flight", "Requests being processed", ("route_class",)),
+    "queue": metrics_registry.gauge(
+        "concurrency_queue_length", "Requests waiting for a concurrency slot", ("route_class",)),
+    "rejected": metrics_registry.counter(
+        "concurrency_rejected_total", "Requests rejected with 503 by the concurrency limiter", ("route_class",)),
+}
+
+stream_metrics = {
+    "subscribers": metrics_registry.gauge(
+        "stream_subscribers", "Clients subscribed to /students/stream"),
+    "resyncs": metrics_registry.counter(
+        "stream_resyncs_total", "Stream clients whose queue overflowed and were sent resync"),
+}
+
+# Учет обращений к БД: сколько запросов обслужено вообще без открытия сессии
+db_usage_stats = {"requests": 0, "requests_without_db": 0, "db_sessions": 0}
+# Статистика текущего запроса (сессии, запросы к БД и время в них). Словарь изменяется
+# на месте, поэтому изменения видны и из потоков пула, в которых FastAPI выполняет
+# синхронные зависимости
+request_db_usage: ContextVar[Optional[dict]] = ContextVar("request_db_usage", default=None)
+
+# Сессия БД, которая создается при первом обращении к ней. Запрос, обслуженный
+# из кеша, так и не берет соединение из пула
+class LazySession:
+    def __init__(self, session_factory):
+        self._session_factory = session_factory
+        self._session = None
+
+    @property
+    def is_open(self):
+        return self._session is not None
+
+    def __getattr__(self, name):
+        if self._session is None:
+            self._session = self._session_factory()
+            db_usage_stats["db_sessions"] += 1
+            usage = request_db_usage.get()
+            if usage is not None:
+                usage["db_sessions"] += 1
+        return getattr(self._session, name)
+
+    # Возвращает соединение в пул; при следующем обращении сессия откроется заново
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def row_fingerprint(surname, name, faculty, subject, score):
+    data = "\x1f".join(str(value).strip() for value in (surname, name, faculty, subject, score))
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+# Отпечаток строки-дубликата: отпечаток первой копии занят, поэтому к нему добавляется id.
+# Такая строка уже обработана, и ее не нужно пересчитывать при каждом импорте
+def duplicate_fingerprint(fingerprint, student_id):
+    return f"{fingerprint}:{student_id}"
+
+# Строки CSV вместе со смещением в файле сразу после каждой строки. Файл открыт в
+# двоичном режиме, поэтому смещения точные и по ним можно продолжить чтение
+def iter_csv_rows(csv_file, header):
+    position = csv_file.tell()
+
+    def lines():
+        nonlocal position
+        for line in csv_file:
+            position += len(line)
+            yield line.decode("utf-8")
+
+    for record in csv.reader(lines()):
+        if record:
+            yield dict(zip(header, record)), position
+
+# Версия данных: последняя версия журнала изменений student_changes. Журнал хранится
+# в БД, поэтому версия переживает перезапуск Redis, и старый ETag не совпадет с новыми
+# данными; Redis только кеширует ее. Версия входит в ключи кеша и в ETag, поэтому старые
+# записи кеша просто перестают использоваться и истекают сами, без flushdb
+def redis_command(redis_client, command, *args):
+    start = time.perf_counter()
+    try:
+        return getattr(redis_client, command)(*args)
+    finally:
+        redis_command_duration.observe(time.perf_counter() - start, (command,))
+
+def read_data_version(db_manager):
+    with db_manager.SessionLocal() as db:
+        return db_manager.get_latest_change_version(db)
+
+# Версия в Redis только растет: запись, закончившаяся раньше, не должна затереть
+# более новую версию параллельной записи
+def store_data_version(redis_client, version):
+    def update(pipe):
+        current = pipe.get(DATA_VERSION_KEY)
+        pipe.multi()
+        if current is None or int(current) < version:
+            pipe.set(DATA_VERSION_KEY, version, ex=REDIS_CACHE_EXPIRE)
+
+    redis_command(redis_client, "transaction", update, DATA_VERSION_KEY)
+
+def get_data_version(redis_client, db_manager):
+    cached = redis_command(redis_client, "get", DATA_VERSION_KEY)
+    if cached is not None:
+        return int(cached)
+    version = read_data_version(db_manager)
+    store_data_version(redis_client, version)
+    return version
+
+def bump_data_version(redis_client, db_manager):
+    try:
+        store_data_version(redis_client, read_data_version(db_manager))
+    except redis.RedisError as e:
+        print(f"Failed to bump data version: {e}")
+
 # Декоратор для кеширования
 def cache_response(key_prefix: str, expire: int = REDIS_CACHE_EXPIRE):
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Генерация ключа кеша на основе параметров запроса
+            # Генерация ключа кеша на основе версии данных и параметров запроса
             request = kwargs.get('request')
-            cache_key = f"{key_prefix}:{request.url.path}"
+            redis_client = request.app.state.resources.redis
+            version = getattr(request.state, "data_version", None)
+            if version is None:
+                version = get_data_version(redis_client, request.app.state.resources.db_manager)
+            cache_key = f"{key_prefix}:v{version}:{request.url.path}"
+            if request.url.query:
+                cache_key = f"{cache_key}?{request.url.query}"
             
             # Попытка получить данные из кеша
-            cached_data = redis_client.get(cache_key)
+            cached_data = redis_command(redis_client, "get", cache_key)
             if cached_data:
+                cache_requests_total.inc((key_prefix, "hit"))
                 return json.loads(cached_data)
+            cache_requests_total.inc((key_prefix, "miss"))
             
             # Если данных нет в кеше, выполняем функцию
             response = await func(*args, **kwargs)
+            # Результат уже загружен - освобождаем соединение до сериализации и записи в кеш
+            db = kwargs.get('db')
+            if isinstance(db, LazySession):
+                db.close()
             
             # Сохраняем результат в кеш
-            redis_client.setex(cache_key, expire, json.dumps(response))
+            redis_command(redis_client, "setex", cache_key, expire, json.dumps(jsonable_encoder(response)))
             
             return response
+        # По префиксу middleware условных запросов узнает кешируемые маршруты
+        wrapper.cache_key_prefix = key_prefix
         return wrapper
     return decorator
 
+query_logger = logging.getLogger("students.queries")
+
+# Приводит SQL к форме без литералов и с одним плейсхолдером в IN (...), чтобы
+# одинаковые по форме запросы считались одним
+@lru_cache(maxsize=1024)
+def normalize_sql(statement):
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+(?:\.\d+)?\b", "?", statement)
+    statement = re.sub(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)+\s*\)", "IN (?)", statement, flags=re.IGNORECASE)
+    return " ".join(statement.split())
+
+def describe_parameters(parameters, executemany=False):
+    if executemany:
+        return f"{len(parameters)} x {describe_parameters(parameters[0]) if parameters else None}"
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters or ()]
+
 class DatabaseManager:
-    def __init__(self, db_url="sqlite:///./students.db"):
+    def __init__(self, db_url="sqlite:///./students.db", on_change=None,
+                 slow_query_ms=None, repeated_query_threshold=None):
         self.engine = create_engine(db_url)
-        Base.metadata.create_all(bind=self.engine)
+        # Вызывается после каждой успешной записи в таблицу студентов
+        self.on_change = on_change
+        self.slow_query_ms = slow_query_ms
+        self.repeated_query_threshold = repeated_query_threshold
+        if slow_query_ms is not None or repeated_query_threshold is not None:
+            event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(self.engine, "after_cursor_execute", self._after_cursor_execute)
         self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        # Кеш кодов справочников: название -> id. Коды, добавленные в текущей транзакции,
+        # до ее фиксации видны только своей сессии: при откате id пропадет, и другие
+        # потоки не должны успеть взять его из общего кеша
+        self._codes = {Faculty: None, Subject: None}
+        event.listen(self.SessionLocal, "after_commit", self._publish_codes)
+        event.listen(self.SessionLocal, "after_transaction_end", self._discard_codes)
+
+    # Создание и обновление схемы. Конструктор к базе не подключается, схему
+    # обновляет явный шаг миграции (python main.py migrate) или AUTO_MIGRATE.
+    # Актуальная схема отмечена в PRAGMA user_version, и тогда миграция сводится к
+    # одному чтению. Иначе весь DDL выполняется одной транзакцией BEGIN IMMEDIATE:
+    # одновременно запущенные процессы ждут друг друга, а не падают на CREATE
+    def migrate(self):
+        if self.engine.dialect.name != "sqlite":
+            Base.metadata.create_all(bind=self.engine)
+            return
+        if self._schema_version() >= SCHEMA_VERSION:
+            return
+        with self.engine.connect() as conn:
+            # AUTOCOMMIT отключает неявные транзакции драйвера; транзакцию открываем сами
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+            conn.exec_driver_sql("PRAGMA busy_timeout = 600000")
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            try:
+                # другой процесс мог закончить миграцию, пока мы ждали блокировку
+                if conn.exec_driver_sql("PRAGMA user_version").scalar() >= SCHEMA_VERSION:
+                    conn.exec_driver_sql("ROLLBACK")
+                    return
+                legacy_migrated = self.migrate_legacy_schema(conn)
+                Base.metadata.create_all(bind=conn)
+                self.add_fingerprint_column(conn)
+                # create_all не добавляет новые индексы в уже существующие таблицы
+                for index in Student.__table__.indexes:
+                    index.create(bind=conn, checkfirst=True)
+                self.create_search_index(conn)
+                self.create_change_log(conn)
+                # после пересоздания триггеров: заполнение отпечатков не считается изменением данных.
+                # Отпечатков нет и у добавленной колонки, и у строк, перенесенных из старой схемы
+                self._fill_fingerprints(conn)
+                conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.exec_driver_sql("COMMIT")
+            except Exception:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            if legacy_migrated:
+                # Возвращаем освободившееся место файлу базы
+                conn.exec_driver_sql("VACUUM")
+
+    def _schema_version(self):
+        with self.engine.connect() as conn:
+            return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        context.diagnostics_start_time = time.perf_counter()
+
+    # Журнал медленных запросов (с планом выполнения) и детектор N+1: один и тот же
+    # по форме запрос выполнен в рамках HTTP-запроса больше repeated_query_threshold раз
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - context.diagnostics_start_time) * 1000
+        usage = request_db_usage.get()
+        scope = usage.get("scope") if usage is not None else None
+        route = None
+        if scope is not None:
+            route = getattr(scope.get("route"), "path", scope.get("path"))
+
+        if self.slow_query_ms is not None and duration_ms >= self.slow_query_ms:
+            entry = {
+                "sql": normalize_sql(statement),
+                "parameters": describe_parameters(parameters, executemany),
+                "duration_ms": round(duration_ms, 3),
+                "route": route,
+                "plan": self._explain(cursor, statement, parameters, executemany),
+            }
+            query_logger.warning("slow query: %s", json.dumps(entry, ensure_ascii=False))
+
+        if self.repeated_query_threshold is not None and usage is not None:
+            statements = usage.setdefault("statements", {})
+            shape = normalize_sql(statement)
+            statements[shape] = statements.get(shape, 0) + 1
+            if statements[shape] == self.repeated_query_threshold + 1:
+                query_logger.warning(
+                    "possible N+1: statement executed more than %d times in %s: %s",
+                    self.repeated_query_threshold, route, shape,
+                )
+
+    def _explain(self, cursor, statement, parameters, executemany):
+        if self.engine.dialect.name != "sqlite":
+            return None
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        try:
+            rows = cursor.connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+        except Exception as e:
+            return f"unavailable: {e}"
+        return [row[-1] for row in rows]
+
+    # Миграция со старой схемы, где faculty и subject хранились строками в каждой записи
+    def migrate_legacy_schema(self, conn):
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(students)"))]
+        if "faculty" not in columns or "faculty_id" in columns:
+            return False
+        print("Migrating students table to faculties/subjects lookup tables...")
+        for trigger in ("students_fts_ai", "students_fts_ad", "students_fts_au"):
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(text("DROP TABLE IF EXISTS students_fts"))
+        for column in ("id", "surname", "name", "faculty", "subject"):
+            conn.execute(text(f"DROP INDEX IF EXISTS ix_students_{column}"))
+        conn.execute(text("ALTER TABLE students RENAME TO students_legacy"))
+        Base.metadata.create_all(bind=conn)
+        conn.execute(text(
+            "INSERT OR IGNORE INTO faculties (name) "
+            "SELECT DISTINCT faculty FROM students_legacy WHERE faculty IS NOT NULL"
+        ))
+        conn.execute(text(
+            "INSERT OR IGNORE INTO subjects (name) "
+            "SELECT DISTINCT subject FROM students_legacy WHERE subject IS NOT NULL"
+        ))
+        conn.execute(text("""
+            INSERT INTO students (id, surname, name, faculty_id, subject_id, score)
+            SELECT l.id, l.surname, l.name, f.id, s.id, l.score
+            FROM students_legacy l
+            LEFT JOIN faculties f ON f.name = l.faculty
+            LEFT JOIN subjects s ON s.name = l.subject
+        """))
+        conn.execute(text("DROP TABLE students_legacy"))
+        return True
+
+    # Колонка отпечатков для баз, созданных до нее
+    def add_fingerprint_column(self, conn):
+        columns = [row[1] for row in conn.execute(text("PRAGMA table_info(students)"))]
+        if "fingerprint" not in columns:
+            conn.execute(text("ALTER TABLE students ADD COLUMN fingerprint VARCHAR"))
+
+    # Отпечатки для студентов без них (добавленных через API, восстановленных из снимка,
+    # перенесенных из старой схемы): уже загруженные из того же файла строки не будут
+    # импортированы повторно. Из одинаковых строк отпечаток получает первая, остальные -
+    # отпечаток дубликата; OR IGNORE - отпечаток мог успеть занять параллельный импорт
+    def _fill_fingerprints(self, conn):
+        seen = {row[0] for row in conn.execute(text(
+            "SELECT fingerprint FROM students WHERE fingerprint IS NOT NULL"))}
+        updates = []
+        rows = conn.execute(text("""
+            SELECT s.id, s.surname, s.name, f.name, sub.name, s.score
+            FROM students s
+            LEFT JOIN faculties f ON f.id = s.faculty_id
+            LEFT JOIN subjects sub ON sub.id = s.subject_id
+            WHERE s.fingerprint IS NULL ORDER BY s.id
+        """))
+        for student_id, *values in rows:
+            fingerprint = row_fingerprint(*values)
+            if fingerprint in seen:
+                fingerprint = duplicate_fingerprint(fingerprint, student_id)
+            seen.add(fingerprint)
+            updates.append({"id": student_id, "fingerprint": fingerprint})
+        if updates:
+            conn.execute(text("UPDATE OR IGNORE students SET fingerprint = :fingerprint WHERE id = :id"), updates)
+
+    # Полнотекстовый индекс FTS5 по студентам. Внешний контент берется из представления
+    # students_named (студенты с названиями из справочников), а триггеры поддерживают
+    # индекс при любой записи (включая fill_from_csv)
+    def create_search_index(self, conn):
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'students_fts'"
+        )).first()
+        # триггеры пересоздаются, чтобы старые базы получили текущую версию
+        for trigger in SEARCH_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        conn.execute(text("""
+            CREATE VIEW IF NOT EXISTS students_named AS
+            SELECT s.id, s.surname, s.name, f.name AS faculty, sub.name AS subject
+            FROM students s
+            LEFT JOIN faculties f ON f.id = s.faculty_id
+            LEFT JOIN subjects sub ON sub.id = s.subject_id
+        """))
+        conn.execute(text("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS students_fts USING fts5(
+                surname, name, faculty, subject,
+                content='students_named', content_rowid='id',
+                tokenize='unicode61', prefix='2 3'
+            )
+        """))
+        self._create_search_triggers(conn)
+        # Индекс создан для уже заполненной базы - строим его по существующим строкам
+        if not exists:
+            conn.execute(text("INSERT INTO students_fts(students_fts) VALUES ('rebuild')"))
+
+    def _create_search_triggers(self, conn):
+        conn.execute(text("""
+            CREATE TRIGGER students_fts_ai AFTER INSERT ON students BEGIN
+                INSERT INTO students_fts(rowid, surname, name, faculty, subject)
+                VALUES (new.id, new.surname, new.name,
+                        (SELECT name FROM faculties WHERE id = new.faculty_id),
+                        (SELECT name FROM subjects WHERE id = new.subject_id));
+            END
+        """))
+        conn.execute(text("""
+            CREATE TRIGGER students_fts_ad AFTER DELETE ON students BEGIN
+                INSERT INTO students_fts(students_fts, rowid, surname, name, faculty, subject)
+                VALUES ('delete', old.id, old.surname, old.name,
+                        (SELECT name FROM faculties WHERE id = old.faculty_id),
+                        (SELECT name FROM subjects WHERE id = old.subject_id));
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER students_fts_au AFTER UPDATE OF {STUDENT_DATA_COLUMNS} ON students BEGIN
+                INSERT INTO students_fts(students_fts, rowid, surname, name, faculty, subject)
+                VALUES ('delete', old.id, old.surname, old.name,
+                        (SELECT name FROM faculties WHERE id = old.faculty_id),
+                        (SELECT name FROM subjects WHERE id = old.subject_id));
+                INSERT INTO students_fts(rowid, surname, name, faculty, subject)
+                VALUES (new.id, new.surname, new.name,
+                        (SELECT name FROM faculties WHERE id = new.faculty_id),
+                        (SELECT name FROM subjects WHERE id = new.subject_id));
+            END
+        """))
+
+    # Триггеры журнала изменений. Для базы, в которой студенты уже были, журнал
+    # начинается с записи "insert" для каждого существующего студента
+    def create_change_log(self, conn):
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'student_changes_ai'"
+        )).first()
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(student_changes)"))}
+        for column in ("faculty_id", "subject_id"):
+            if column not in columns:
+                conn.execute(text(f"ALTER TABLE student_changes ADD COLUMN {column} INTEGER"))
+        # триггеры пересоздаются, чтобы старые базы получили текущую версию
+        for trigger in CHANGE_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+        self._create_change_triggers(conn)
+        if not exists:
+            self._log_all_students(conn, "insert")
+
+    def _create_change_triggers(self, conn):
+        for trigger, event_name, op, row in (
+            ("student_changes_ai", "INSERT", "insert", "new"),
+            ("student_changes_au", f"UPDATE OF {STUDENT_DATA_COLUMNS}", "update", "old"),
+            ("student_changes_ad", "DELETE", "delete", "old"),
+        ):
+            conn.execute(text(f"""
+                CREATE TRIGGER {trigger} AFTER {event_name} ON students BEGIN
+                    INSERT INTO student_changes (student_id, op, updated_at, faculty_id, subject_id)
+                    VALUES ({row}.id, '{op}', {CHANGE_TIMESTAMP_SQL}, {row}.faculty_id, {row}.subject_id);
+                END
+            """))
+
+    # Одна запись журнала с операцией op на каждого студента таблицы
+    def _log_all_students(self, conn, op):
+        conn.execute(text(f"""
+            INSERT INTO student_changes (student_id, op, updated_at, faculty_id, subject_id)
+            SELECT id, '{op}', {CHANGE_TIMESTAMP_SQL}, faculty_id, subject_id FROM students ORDER BY id
+        """))
+
+    # Полная замена таблицы студентов строками (id, surname, name, faculty_id,
+    # subject_id, score) одной транзакцией, например при восстановлении снимка.
+    # Построчные триггеры журнала изменений и полнотекстового индекса на время
+    # вставки снимаются: журнал и индекс обновляются отдельными запросами по всей
+    # таблице. Отпечатки строк вычисляются заново, как при миграции
+    def replace_students(self, db, rows, chunk_size=50000):
+        conn = db.connection()
+        faculties = dict(conn.execute(select(Faculty.id, Faculty.name)).all())
+        subjects = dict(conn.execute(select(Subject.id, Subject.name)).all())
+        fingerprints = set()
+
+        def with_fingerprint(row):
+            student_id, surname, name, faculty_id, subject_id, score = row
+            fingerprint = row_fingerprint(surname, name, faculties.get(faculty_id), subjects.get(subject_id), score)
+            if fingerprint in fingerprints:
+                fingerprint = duplicate_fingerprint(fingerprint, student_id)
+            fingerprints.add(fingerprint)
+            return {"id": student_id, "surname": surname, "name": name, "faculty_id": faculty_id,
+                    "subject_id": subject_id, "score": score, "fingerprint": fingerprint}
+
+        sqlite = self.engine.dialect.name == "sqlite"
+        if sqlite:
+            # первый DML открывает транзакцию, и DDL ниже выполняется уже внутри нее
+            self._log_all_students(conn, "delete")
+            for trigger in SEARCH_TRIGGERS + CHANGE_TRIGGERS:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+            conn.execute(text("INSERT INTO students_fts(students_fts) VALUES ('delete-all')"))
+        conn.execute(text("DELETE FROM students"))
+        rows = iter(rows)
+        count = 0
+        while True:
+            chunk = [with_fingerprint(row) for _, row in zip(range(chunk_size), rows)]
+            if not chunk:
+                break
+            conn.execute(Student.__table__.insert(), chunk)
+            count += len(chunk)
+        if sqlite:
+            self._log_all_students(conn, "insert")
+            conn.execute(text("INSERT INTO students_fts(students_fts) VALUES ('rebuild')"))
+            self._create_search_triggers(conn)
+            self._create_change_triggers(conn)
+        db.commit()
+        self._notify_change()
+        return count
+
+    def _notify_change(self):
+        if self.on_change is not None:
+            self.on_change()
+
+    def _publish_codes(self, session):
+        for (model, value), code in session.info.pop(PENDING_CODES_KEY, {}).items():
+            if self._codes[model] is not None:
+                self._codes[model][value] = code
+
+    # Откат, закрытие сессии без commit: незафиксированные коды забываются
+    def _discard_codes(self, session, transaction):
+        if transaction.parent is None:
+            session.info.pop(PENDING_CODES_KEY, None)
+
+    # Код справочника по названию из кеша в памяти, при промахе - из БД; при create=True отсутствующее
+    # значение добавляется в справочник
+    def _get_code(self, db, model, value, create=False):
+        if value is None:
+            return None
+        codes = self._codes[model]
+        if codes is None:
+            codes = dict(db.query(model.name, model.id).all())
+            self._codes[model] = codes
+        code = codes.get(value)
+        if code is None:
+            # коды, которые эта сессия добавила сама и еще не зафиксировала
+            pending = db.info.setdefault(PENDING_CODES_KEY, {})
+            code = pending.get((model, value))
+        if code is None:
+            # кеш мог устареть: значение добавил другой воркер после загрузки кеша
+            inserted = False
+            if create:
+                result = db.execute(sqlite_insert(model).values(name=value).on_conflict_do_nothing())
+                inserted = result.rowcount == 1
+            code = db.query(model.id).filter(model.name == value).scalar()
+            if code is not None:
+                if inserted:
+                    # в общий кеш код попадет после commit (_publish_codes)
+                    pending[(model, value)] = code
+                else:
+                    codes[value] = code
+        return code
+
+    # Отпечаток студента, добавленного или измененного через API, чтобы fill_from_csv не
+    # искал строки без отпечатков. Запись в SQLite уже заблокирована flush, поэтому
+    # проверка занятости отпечатка и его установка не разделяются параллельным импортом
+    def _set_fingerprint(self, db, student):
+        db.flush()
+        values = db.execute(
+            select(Student.surname, Student.name, Student.faculty, Student.subject, Student.score)
+            .where(Student.id == student.id)
+        ).one()
+        fingerprint = row_fingerprint(*values)
+        if student.fingerprint == fingerprint:
+            return
+        taken = db.query(Student.id).filter(Student.fingerprint == fingerprint, Student.id != student.id).first()
+        student.fingerprint = duplicate_fingerprint(fingerprint, student.id) if taken else fingerprint
+
+    # Заменяет названия факультета и курса на коды справочников
+    def _encode_student_data(self, db, student_data):
+        data = dict(student_data)
+        if "faculty" in data:
+            data["faculty_id"] = self._get_code(db, Faculty, data.pop("faculty"), create=True)
+        if "subject" in data:
+            data["subject_id"] = self._get_code(db, Subject, data.pop("subject"), create=True)
+        return data
 
     def get_db(self):
-        db = self.SessionLocal()
+        db = LazySession(self.SessionLocal)
         try:
             yield db
         finally:
@@ -138,7 +850,7 @@ class DatabaseManager:
         return db.query(User).filter(User.username == username).first()
 
     def create_user(self, db, user: UserCreate):
-        hashed_password = pwd_context.hash(user.password)
+        hashed_password = get_pwd_context().hash(user.password)
         db_user = User(
             username=user.username,
             email=user.email,
@@ -151,142 +863,1070 @@ class DatabaseManager:
 
     # Методы для работы со студентами
     def insert_student(self, db, student_data):
-        db_student = Student(**student_data)
         try:
+            db_student = Student(**self._encode_student_data(db, student_data))
             db.add(db_student)
+            self._set_fingerprint(db, db_student)
             db.commit()
             db.refresh(db_student)
+            self._notify_change()
             return db_student
         except IntegrityError as e:
             db.rollback()
             print(f"Error inserting student: {e}")
             return None
 
-    def fill_from_csv(self, db, csv_filepath):
+    # Идемпотентный импорт CSV. Прерванный импорт того же файла (по контрольной сумме)
+    # продолжается с последней зафиксированной пачки, завершенный не повторяется.
+    # Строки, отпечаток которых уже есть в таблице, пропускаются через
+    # ON CONFLICT DO NOTHING, поэтому пересекающиеся файлы тоже не дают дубликатов
+    def fill_from_csv(self, db, csv_filepath, chunk_size=CSV_IMPORT_CHUNK):
+        inserted_count = 0
         try:
-            with open(csv_filepath, mode="r", encoding="utf-8") as csv_file:
-                csv_reader = csv.DictReader(csv_file)
+            csv_import = self._get_csv_import(db, csv_filepath)
+            if csv_import.status == "done":
+                print(f"CSV file {csv_filepath} has already been imported")
+                return 0
+            # отпечатки ставят все пути записи, так что строки без отпечатка бывают
+            # только после записи в обход DatabaseManager
+            if db.query(Student.id).filter(Student.fingerprint.is_(None)).first() is not None:
+                self._fill_fingerprints(db.connection())
+                db.commit()
+            with open(csv_filepath, mode="rb") as csv_file:
+                header = next(csv.reader([csv_file.readline().decode("utf-8-sig")]), [])
+                csv_file.seek(max(csv_import.byte_offset, csv_file.tell()))
                 line_count = 0
-                inserted_count = 0
-                for row in csv_reader:
-                    if line_count == 0:
-                        line_count += 1
-                        continue
-                    student_data = {
-                        "surname": row["Фамилия"],
-                        "name": row["Имя"],
-                        "faculty": row["Факультет"],
-                        "subject": row["Курс"],
-                        "score": int(row["Оценка"]),
-                    }
-                    if self.insert_student(db, student_data):
-                        inserted_count += 1
+                rows = []
+                invalid = 0
+                offset = csv_file.tell()
+                for row, offset in iter_csv_rows(csv_file, header):
                     line_count += 1
-                print(f"Processed {line_count} lines, inserted {inserted_count} students.")
-                return inserted_count
+                    try:
+                        score = int(row["Оценка"])
+                        # Коды факультета и курса берутся из кеша справочников в памяти
+                        rows.append({
+                            "surname": row["Фамилия"],
+                            "name": row["Имя"],
+                            "faculty_id": self._get_code(db, Faculty, row["Факультет"], create=True),
+                            "subject_id": self._get_code(db, Subject, row["Курс"], create=True),
+                            "score": score,
+                            "fingerprint": row_fingerprint(row["Фамилия"], row["Имя"], row["Факультет"], row["Курс"], score),
+                        })
+                    except (KeyError, ValueError):
+                        invalid += 1
+                    if len(rows) + invalid >= chunk_size:
+                        inserted_count += self._import_chunk(db, csv_import, rows, invalid, offset)
+                        rows, invalid = [], 0
+                inserted_count += self._import_chunk(db, csv_import, rows, invalid, offset, done=True)
+            print(f"Processed {line_count} lines, inserted {inserted_count} students "
+                  f"({csv_import.rows_duplicate} duplicates and {csv_import.rows_invalid} invalid rows skipped in total).")
+            return inserted_count
         except Exception as e:
+            db.rollback()
             print(f"Error processing CSV file: {e}")
-            return 0
+            return inserted_count
+        finally:
+            if inserted_count:
+                self._notify_change()
+
+    def _get_csv_import(self, db, csv_filepath):
+        checksum = file_checksum(csv_filepath)
+        csv_import = db.query(CSVImport).filter(CSVImport.checksum == checksum).first()
+        if csv_import is None:
+            db.execute(sqlite_insert(CSVImport).values(
+                checksum=checksum,
+                path=os.path.abspath(csv_filepath),
+                size=os.path.getsize(csv_filepath),
+                started_at=datetime.now().isoformat(timespec="seconds"),
+            ).on_conflict_do_nothing())
+            db.commit()
+            csv_import = db.query(CSVImport).filter(CSVImport.checksum == checksum).first()
+        return csv_import
+
+    # Пачка строк и новое смещение в файле фиксируются одной транзакцией
+    def _import_chunk(self, db, csv_import, rows, invalid, offset, done=False):
+        inserted = 0
+        if rows:
+            result = db.connection().execute(
+                sqlite_insert(Student.__table__).on_conflict_do_nothing(index_elements=["fingerprint"]),
+                rows,
+            )
+            inserted = result.rowcount
+        csv_import.byte_offset = offset
+        csv_import.rows_inserted += inserted
+        csv_import.rows_duplicate += len(rows) - inserted
+        csv_import.rows_invalid += invalid
+        if done:
+            csv_import.status = "done"
+            csv_import.finished_at = datetime.now().isoformat(timespec="seconds")
+        db.commit()
+        return inserted
 
     def delete_students(self, db, student_ids: List[int]):
         try:
             result = db.query(Student).filter(Student.id.in_(student_ids)).delete(synchronize_session=False)
             db.commit()
+            if result:
+                self._notify_change()
             return result
         except Exception as e:
             db.rollback()
             print(f"Error deleting students: {e}")
             return 0
 
-    # Остальные методы остаются без изменений
-    # ... (get_students_by_faculty, get_unique_subjects и т.д.)
+    def get_students_by_faculty(self, db, faculty_name):
+        faculty_id = self._get_code(db, Faculty, faculty_name)
+        if faculty_id is None:
+            return []
+        students = db.query(Student).filter(Student.faculty_id == faculty_id).all()
+        return students
 
-# Инициализация приложения
-app = FastAPI()
-db_manager = DatabaseManager()
+    def get_unique_subjects(self, db):
+        used_subjects = db.query(Student.subject_id).distinct()
+        unique_subjects = db.query(Subject.name).filter(Subject.id.in_(used_subjects)).all()
+        return [subject[0] for subject in unique_subjects]
+
+    def get_average_score_by_faculty(self, db, faculty_name):
+        faculty_id = self._get_code(db, Faculty, faculty_name)
+        if faculty_id is None:
+            return 0
+        result = db.query(Student.faculty_id, func.avg(Student.score)).filter(Student.faculty_id == faculty_id).group_by(Student.faculty_id).first()
+        if result:
+             return result[1]
+        return 0
+
+    # Средний, минимальный и максимальный балл и число оценок сразу по всем факультетам
+    # (при by_subject - по всем курсам) одним GROUP BY по целочисленным кодам.
+    # faculty_names ограничивает студентов, по которым считаются средние
+    def get_average_scores(self, db, faculty_names=None, by_subject=False):
+        field, model, group_column = (
+            ("subject", Subject, Student.subject_id) if by_subject else ("faculty", Faculty, Student.faculty_id)
+        )
+        query = db.query(
+            model.name,
+            func.avg(Student.score),
+            func.count(Student.score),
+            func.min(Student.score),
+            func.max(Student.score),
+        ).join(model, model.id == group_column)
+        if faculty_names:
+            faculty_ids = [self._get_code(db, Faculty, name) for name in faculty_names]
+            faculty_ids = [faculty_id for faculty_id in faculty_ids if faculty_id is not None]
+            if not faculty_ids:
+                return []
+            query = query.filter(Student.faculty_id.in_(faculty_ids))
+
+        return [
+            {
+                field: name,
+                "average_score": average,
+                "count": count,
+                "min_score": min_score,
+                "max_score": max_score,
+            }
+            for name, average, count, min_score, max_score in query.group_by(group_column).order_by(group_column)
+        ]
+
+    # Первые k студентов по оценке внутри курса (ROW_NUMBER по индексу subject_id, score).
+    # Без subject - топ-k сразу для каждого курса одним запросом
+    def get_ranked_students(self, db, subject=None, k=10, ascending=False, score_min=None, score_max=None):
+        score_order = Student.score.asc() if ascending else Student.score.desc()
+        rank = func.row_number().over(partition_by=Student.subject_id, order_by=(score_order, Student.id))
+        ranked = db.query(Student.id.label("id"), rank.label("rank"))
+        if subject is not None:
+            subject_id = self._get_code(db, Subject, subject)
+            if subject_id is None:
+                return []
+            ranked = ranked.filter(Student.subject_id == subject_id)
+        if score_min is not None:
+            ranked = ranked.filter(Student.score >= score_min)
+        if score_max is not None:
+            ranked = ranked.filter(Student.score <= score_max)
+        ranked = ranked.subquery()
+
+        rows = (
+            db.query(Student, ranked.c.rank)
+            .join(ranked, ranked.c.id == Student.id)
+            .filter(ranked.c.rank <= k)
+            .order_by(Student.subject_id, ranked.c.rank)
+            .all()
+        )
+        students = []
+        for student, student_rank in rows:
+            student.rank = student_rank
+            students.append(student)
+        return students
+
+    def get_students_by_score_range(self, db, subject, score_min=None, score_max=None, skip=0, limit=100):
+        subject_id = self._get_code(db, Subject, subject)
+        if subject_id is None:
+            return []
+        query = db.query(Student).filter(Student.subject_id == subject_id)
+        if score_min is not None:
+            query = query.filter(Student.score >= score_min)
+        if score_max is not None:
+            query = query.filter(Student.score <= score_max)
+        return query.order_by(Student.score, Student.id).offset(skip).limit(limit).all()
+
+    def get_low_score_students_by_subject(self, db, subject, threshold=30):
+        subject_id = self._get_code(db, Subject, subject)
+        if subject_id is None:
+            return []
+        students = db.query(Student).filter(Student.subject_id == subject_id, Student.score < threshold).all()
+        return students
+
+    def get_student(self, db, student_id: int):
+        return db.query(Student).filter(Student.id == student_id).first()
+
+    def get_all_students(self, db):
+        return db.query(Student).all()
+
+    def update_student(self, db, student_id: int, student_data: dict):
+        db_student = db.query(Student).filter(Student.id == student_id).first()
+        if not db_student:
+            return None
+
+        student_data = {key: value for key, value in student_data.items() if value is not None}
+        for key, value in self._encode_student_data(db, student_data).items():
+            if value is not None:
+                setattr(db_student, key, value)
+        self._set_fingerprint(db, db_student)
+
+        db.commit()
+        db.refresh(db_student)
+        self._notify_change()
+        return db_student
+
+    def delete_student(self, db, student_id: int):
+        db_student = db.query(Student).filter(Student.id == student_id).first()
+        if not db_student:
+            return False
+
+        db.delete(db_student)
+        db.commit()
+        self._notify_change()
+        return True
+
+    # Поиск по префиксам слов с ранжированием bm25: фамилия весит больше имени,
+    # имя - больше факультета и курса
+    def search_students(self, db, query: str, skip: int = 0, limit: int = 100):
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+        match = " ".join(f'"{term}"*' for term in terms)
+        # Запрос строится через ORM, чтобы названия факультета и курса (column_property)
+        # пришли тем же SELECT, а не отдельным запросом на каждую найденную строку
+        return (
+            db.query(Student)
+            .join(STUDENTS_FTS, STUDENTS_FTS.c.rowid == Student.id)
+            .filter(text("students_fts MATCH :match"))
+            .order_by(text("bm25(students_fts, 10.0, 5.0, 1.0, 1.0)"))
+            .offset(skip)
+            .limit(limit)
+            .params(match=match)
+            .all()
+        )
+
+    # Изменения после версии since: по одной записи на студента с его последней версией
+    # и текущими данными (или без данных, если студент удален). Стоимость зависит
+    # от числа изменений, а не от размера таблицы
+    def get_changes(self, db, since: int = 0, limit: int = 1000):
+        latest = (
+            select(StudentChange.student_id, func.max(StudentChange.version).label("version"))
+            .where(StudentChange.version > since)
+            .group_by(StudentChange.student_id)
+            .order_by(func.max(StudentChange.version))
+            .limit(limit + 1)
+            .subquery()
+        )
+        rows = db.execute(
+            select(StudentChange, Student)
+            .join(latest, StudentChange.version == latest.c.version)
+            .outerjoin(Student, Student.id == StudentChange.student_id)
+            .order_by(StudentChange.version)
+        ).all()
+        has_more = len(rows) > limit
+        changes = [
+            {
+                "version": change.version,
+                "op": "delete" if student is None else change.op,
+                "student_id": change.student_id,
+                "updated_at": change.updated_at,
+                "student": student,
+            }
+            for change, student in rows[:limit]
+        ]
+        return {
+            "since": since,
+            "next_since": changes[-1]["version"] if changes else since,
+            "has_more": has_more,
+            "changes": changes,
+        }
+
+    def get_latest_change_version(self, db):
+        return db.query(func.max(StudentChange.version)).scalar() or 0
+
+    # Записи журнала после версии since без свертки, для потока изменений. Кроме
+    # текущих данных студента возвращаются факультет и курс до изменения
+    def get_change_events(self, db, since: int, limit: int = 1000):
+        old_faculty = aliased(Faculty)
+        old_subject = aliased(Subject)
+        rows = db.execute(
+            select(StudentChange, Student, old_faculty.name, old_subject.name)
+            .outerjoin(Student, Student.id == StudentChange.student_id)
+            .outerjoin(old_faculty, old_faculty.id == StudentChange.faculty_id)
+            .outerjoin(old_subject, old_subject.id == StudentChange.subject_id)
+            .where(StudentChange.version > since)
+            .order_by(StudentChange.version)
+            .limit(limit)
+        ).all()
+        events = []
+        for change, student, faculty, subject in rows:
+            faculties = {faculty}
+            subjects = {subject}
+            if student is not None:
+                faculties.add(student.faculty)
+                subjects.add(student.subject)
+            events.append({
+                "version": change.version,
+                "faculties": faculties,
+                "subjects": subjects,
+                "data": {
+                    "version": change.version,
+                    "op": change.op,
+                    "student_id": change.student_id,
+                    "updated_at": change.updated_at,
+                    # студент уже удален: событие delete придет следом
+                    "student": None if student is None else {
+                        field: getattr(student, field) for field in StudentResponse.__fields__
+                    },
+                },
+            })
+        return events
+
+    # Распределение оценок по факультетам или курсам за один проход по отсортированным
+    # строкам: размер группы заранее известен из оконной функции, поэтому перцентили
+    # (по ближайшему рангу), среднее, дисперсия и гистограмма считаются на лету
+    def get_score_distribution(self, db, group_by="faculty", bucket_size=10):
+        model, column = {"faculty": (Faculty, "faculty_id"), "subject": (Subject, "subject_id")}[group_by]
+        statement = text(f"""
+            SELECT g.name, s.score, COUNT(*) OVER (PARTITION BY s.{column}) AS group_count
+            FROM students s
+            JOIN {model.__tablename__} g ON g.id = s.{column}
+            WHERE s.score IS NOT NULL
+            ORDER BY s.{column}, s.score
+        """)
+        percentiles = (50, 90, 99)
+        groups = []
+        current = None
+        for group_name, score, group_count in db.execute(statement):
+            if current is None or current["group"] != group_name:
+                current = {
+                    "group": group_name,
+                    "count": 0,
+                    "mean": 0.0,
+                    "stddev": 0.0,
+                    "min": score,
+                    "max": score,
+                    **{f"p{p}": None for p in percentiles},
+                    "histogram": {},
+                    "_m2": 0.0,
+                    "_ranks": {p: math.ceil(p / 100 * group_count) for p in percentiles},
+                }
+                groups.append(current)
+            current["count"] += 1
+            # Алгоритм Уэлфорда для среднего и дисперсии
+            delta = score - current["mean"]
+            current["mean"] += delta / current["count"]
+            current["_m2"] += delta * (score - current["mean"])
+            current["max"] = score
+            for p, rank in current["_ranks"].items():
+                if current["count"] == rank:
+                    current[f"p{p}"] = score
+            bucket = score // bucket_size * bucket_size
+            current["histogram"][bucket] = current["histogram"].get(bucket, 0) + 1
+
+        for group in groups:
+            group["stddev"] = math.sqrt(group.pop("_m2") / group["count"])
+            del group["_ranks"]
+            group["histogram"] = [
+                {"from": bucket, "to": bucket + bucket_size - 1, "count": count}
+                for bucket, count in group["histogram"].items()
+            ]
+        return groups
+
+# Настройки приложения для create_app; по умолчанию - из констант и окружения
+@dataclass
+class Settings:
+    database_url: str = DATABASE_URL
+    redis_host: str = REDIS_HOST
+    redis_port: int = REDIS_PORT
+    redis_db: int = REDIS_DB
+    auto_migrate: bool = AUTO_MIGRATE
+    slow_query_ms: Optional[float] = SLOW_QUERY_MS
+    repeated_query_threshold: Optional[int] = REPEATED_QUERY_THRESHOLD
+    stream_poll_interval: float = STREAM_POLL_INTERVAL
+    stream_queue_size: int = STREAM_QUEUE_SIZE
+
+# Ресурсы воркера: движок БД с пулом соединений, клиент Redis и кеш пользователей.
+# При импорте модуля ничего не создается; lifespan открывает их при старте каждого
+# воркера, то есть уже после fork, а без lifespan (TestClient без with) - первый запрос
+class AppResources:
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self._db_manager = None
+        self._redis = None
+        self._broadcaster = None
+        self._lock = threading.Lock()
+        self.user_cache = {}
+
+    @property
+    def db_manager(self):
+        if self._db_manager is None:
+            with self._lock:
+                if self._db_manager is None:
+                    self._db_manager = self._create_db_manager()
+        return self._db_manager
+
+    def _create_db_manager(self):
+        db_manager = DatabaseManager(
+            self.settings.database_url,
+            on_change=lambda: bump_data_version(self.redis, self.db_manager),
+            slow_query_ms=self.settings.slow_query_ms,
+            repeated_query_threshold=self.settings.repeated_query_threshold,
+        )
+        if self.settings.auto_migrate:
+            db_manager.migrate()
+        event.listen(db_manager.engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(db_manager.engine, "after_cursor_execute", after_cursor_execute)
+        return db_manager
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            with self._lock:
+                if self._redis is None:
+                    self._redis = redis.Redis(
+                        host=self.settings.redis_host, port=self.settings.redis_port, db=self.settings.redis_db)
+        return self._redis
+
+    @redis.setter
+    def redis(self, client):
+        self._redis = client
+
+    # Рассылка изменений создается при первой подписке и живет в event loop воркера
+    @property
+    def broadcaster(self):
+        if self._broadcaster is None:
+            self._broadcaster = ChangeBroadcaster(
+                fetch=lambda since, limit: self._read(DatabaseManager.get_change_events, since, limit),
+                latest_version=lambda: self._read(DatabaseManager.get_latest_change_version),
+                poll_interval=self.settings.stream_poll_interval,
+                max_queue=self.settings.stream_queue_size,
+                metrics=stream_metrics,
+            )
+        return self._broadcaster
+
+    def _read(self, method, *args):
+        with self.db_manager.SessionLocal() as db:
+            return method(self.db_manager, db, *args)
+
+    def open(self):
+        self.db_manager
+        self.redis
+
+    def close(self):
+        if self._broadcaster is not None:
+            self._broadcaster.close()
+            self._broadcaster = None
+        if self._db_manager is not None:
+            self._db_manager.engine.dispose()
+            self._db_manager = None
+        if self._redis is not None:
+            self._redis.close()
+            self._redis = None
+
+# Зависимости маршрутов: ресурсы берутся из app.state приложения, обслуживающего запрос
+async def get_db_manager(request: Request):
+    return request.app.state.resources.db_manager
+
+def get_db(request: Request):
+    yield from request.app.state.resources.db_manager.get_db()
+
+router = APIRouter()
+
+# Функции для аутентификации
+def verify_password(plain_password, hashed_password):
+    return get_pwd_context().verify(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return get_pwd_context().hash(password)
+
+def authenticate_user(db_manager, db, username: str, password: str):
+    user = db_manager.get_user(db, username)
+    if not user:
+        return False
+    if not verify_password(password, user.hashed_password):
+        return False
+    return user
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
+
+# Пользователи из токенов кешируются в памяти на USER_CACHE_TTL секунд, чтобы запросы,
+# обслуженные из кеша ответов, не обращались к таблице users. Изменение is_active
+# вступает в силу не позже чем через USER_CACHE_TTL. Кеш свой у каждого приложения
+# (AppResources.user_cache): приложения с разными базами не видят чужих пользователей
+def get_cached_user(user_cache, db_manager, db, username: str):
+    now = time.monotonic()
+    cached = user_cache.get(username)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+    user = db_manager.get_user(db, username)
+    if user is not None:
+        # Отсоединяем объект от сессии, чтобы commit в этом же запросе не сбросил его атрибуты
+        db.expunge(user)
+        if len(user_cache) >= USER_CACHE_SIZE:
+            user_cache.clear()
+        user_cache[username] = (user, now + USER_CACHE_TTL)
+    return user
+
+async def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None:
+            raise credentials_exception
+        token_data = TokenData(username=username)
+    except JWTError:
+        raise credentials_exception
+
+    user = get_cached_user(request.app.state.resources.user_cache, db_manager, db, token_data.username)
+    if user is None:
+        raise credentials_exception
+    return user
+
+async def get_current_active_user(current_user: User = Depends(get_current_user)):
+    if current_user.is_active != 1:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
+
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    return current_user
 
 # Фоновые задачи
-def process_csv_import(file_path: str):
+def process_csv_import(db_manager, file_path: str):
     db = next(db_manager.get_db())
     try:
         inserted_count = db_manager.fill_from_csv(db, file_path)
-        # Очищаем кеш после изменения данных
-        redis_client.flushdb()
         return inserted_count
     finally:
         db.close()
 
-def process_students_deletion(student_ids: List[int]):
+def process_students_deletion(db_manager, student_ids: List[int]):
     db = next(db_manager.get_db())
     try:
         deleted_count = db_manager.delete_students(db, student_ids)
-        # Очищаем кеш после изменения данных
-        redis_client.flushdb()
         return deleted_count
     finally:
         db.close()
 
+# Условные GET-запросы: ETag кешируемого маршрута строится из его префикса кеша и
+# версии данных. Совпадение с If-None-Match дает 304 до открытия сессии БД,
+# проверки пользователя и сериализации. Подпись токена проверяется без обращения к БД
+def has_valid_token(request: Request):
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    return True
+
+def match_route(request: Request):
+    for route in router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+async def conditional_get(request: Request, call_next):
+    if request.method != "GET":
+        return await call_next(request)
+    route = match_route(request)
+    scope = getattr(getattr(route, "endpoint", None), "cache_key_prefix", None)
+    if scope is None:
+        return await call_next(request)
+    try:
+        resources = request.app.state.resources
+        version = get_data_version(resources.redis, resources.db_manager)
+    except redis.RedisError:
+        return await call_next(request)
+
+    request.state.data_version = version
+    etag = f'"{scope}-{version}"'
+    if_none_match = request.headers.get("If-None-Match", "")
+    client_etags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if (etag in client_etags or "*" in client_etags) and has_valid_token(request):
+        # Маршрутизатор не вызывается, поэтому маршрут для метрик указываем сами
+        request.scope["route"] = route
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers["ETag"] = etag
+    return response
+
+# Время выполнения SQL-запросов относится к текущему HTTP-запросу
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_start_time = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    usage = request_db_usage.get()
+    if usage is not None:
+        usage["queries"] += 1
+        usage["db_time"] += time.perf_counter() - context.query_start_time
+
+# Латентность и коды ответов по шаблонам маршрутов, запросы к БД на каждый запрос
+# и число запросов, которые завершились без открытия сессии БД
+async def collect_metrics(request: Request, call_next):
+    usage = {"db_sessions": 0, "queries": 0, "db_time": 0.0, "scope": request.scope}
+    token = request_db_usage.set(usage)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        request_db_usage.reset(token)
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        http_requests_total.inc((request.method, route, str(status_code)))
+        http_request_duration.observe(elapsed, (request.method, route))
+        db_queries_total.inc((route,), usage["queries"])
+        db_query_seconds_total.inc((route,), usage["db_time"])
+        db_queries_per_request.observe(usage["queries"], (route,))
+        db_usage_stats["requests"] += 1
+        if usage["db_sessions"] == 0:
+            db_usage_stats["requests_without_db"] += 1
+            http_requests_without_db.inc((route,))
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+# Профилирование по запросу: администратор получает подписанный токен для пути и
+# передает его в заголовке X-Debug-Profile. Без заголовка профилировщик не запускается
+profile_signer = ProfileSigner(SECRET_KEY)
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+@router.post("/debug/profile")
+async def create_profile_token(
+    request: ProfileTokenRequest,
+    current_user: User = Depends(get_current_admin_user)
+):
+    token, expires = profile_signer.create_token(request.path, request.ttl)
+    return {"header": "X-Debug-Profile", "token": token, "path": request.path, "expires": expires}
+
+@router.get("/debug/profile")
+async def list_profiles(current_user: User = Depends(get_current_admin_user)):
+    return profile_store.names()
+
+@router.get("/debug/profile/{name}", response_class=PlainTextResponse)
+async def get_profile(name: str, current_user: User = Depends(get_current_admin_user)):
+    collapsed = profile_store.read(name)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return collapsed
+
+@router.get("/debug/db_usage")
+async def get_db_usage(current_user: User = Depends(get_current_admin_user)):
+    return db_usage_stats
+
+# Маршруты аутентификации
+@router.post("/auth/register", response_model=UserBase)
+def register(
+    user: UserCreate,
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    db_user = db_manager.get_user(db, username=user.username)
+    if db_user:
+        raise HTTPException(status_code=400, detail="Username already registered")
+    return db_manager.create_user(db, user)
+
+# Обычная функция: FastAPI выполняет ее в пуле потоков, и проверка пароля bcrypt
+# не блокирует event loop
+@router.post("/auth/token", response_model=Token)
+def login_for_access_token(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    user = authenticate_user(db_manager, db, form_data.username, form_data.password)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
+
 # Эндпойнты для фоновых задач
-@app.post("/students/import-from-csv")
+@router.post("/students/import-from-csv")
 async def import_from_csv(
     request: CSVImportRequest,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db_manager: DatabaseManager = Depends(get_db_manager)
 ):
     if not os.path.exists(request.file_path):
         raise HTTPException(status_code=400, detail="File not found")
     
-    background_tasks.add_task(process_csv_import, request.file_path)
+    background_tasks.add_task(process_csv_import, db_manager, request.file_path)
     return {"message": "CSV import started in background"}
 
-@app.post("/students/delete-batch")
+@router.post("/students/delete-batch")
 async def delete_students_batch(
     request: DeleteStudentsRequest,
     background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_current_active_user),
+    db_manager: DatabaseManager = Depends(get_db_manager)
 ):
     if not request.student_ids:
         raise HTTPException(status_code=400, detail="No student IDs provided")
     
-    background_tasks.add_task(process_students_deletion, request.student_ids)
+    background_tasks.add_task(process_students_deletion, db_manager, request.student_ids)
     return {"message": "Batch deletion started in background"}
 
 # Пример защищенного эндпойнта с кешированием
-@app.get("/students/", response_model=List[Student])
+@router.get("/students/", response_model=List[StudentResponse])
 @cache_response("students_list")
 async def read_students(
     request: Request,
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(get_current_active_user),
-    db=Depends(db_manager.get_db)
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
 ):
     students = db_manager.get_all_students(db)
     return students[skip : skip + limit]
 
+# Полнотекстовый поиск по фамилии, имени, факультету и курсу (префиксный, с ранжированием)
+@router.get("/students/search", response_model=List[StudentResponse])
+async def search_students(
+    q: str = Query(..., min_length=1),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.search_students(db, q, skip, limit)
+
+# Лента изменений для реплик: вставки, обновления и удаления после версии since.
+# Следующий запрос делается с since=next_since, пока has_more истинно
+@router.get("/students/changes", response_model=StudentChangesResponse)
+async def get_student_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_changes(db, since, limit)
+
+# Поток изменений (Server-Sent Events) вместо периодического опроса. Событие change
+# несет то же, что запись /students/changes; при resync клиент догоняет пропущенное
+# через /students/changes?since=. При переподключении EventSource присылает
+# Last-Event-ID, и если события после него уже прошли, первым приходит resync
+@router.get("/students/stream")
+async def stream_student_changes(
+    request: Request,
+    faculty: Optional[str] = None,
+    subject: Optional[str] = None,
+    since: Optional[int] = Query(None, ge=0),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db)
+):
+    # соединение с БД не должно оставаться занятым на все время потока
+    db.close()
+    if since is None and request.headers.get("Last-Event-ID", "").isdigit():
+        since = int(request.headers["Last-Event-ID"])
+    broadcaster = request.app.state.resources.broadcaster
+    subscription = await broadcaster.subscribe(faculty, subject, since)
+
+    async def events():
+        try:
+            async for chunk in subscription.stream(STREAM_KEEPALIVE):
+                yield chunk
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Остальные эндпойнты с добавлением кеширования
-@app.get("/students/faculty/{faculty_name}", response_model=List[Student])
+@router.get("/students/faculty/{faculty_name}", response_model=List[StudentResponse])
 @cache_response("students_by_faculty")
 async def get_students_by_faculty(
     request: Request,
     faculty_name: str,
     current_user: User = Depends(get_current_active_user),
-    db=Depends(db_manager.get_db)
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
 ):
     return db_manager.get_students_by_faculty(db, faculty_name)
 
-@app.get("/subjects/", response_model=List[str])
+@router.get("/subjects/", response_model=List[str])
 @cache_response("unique_subjects")
 async def get_unique_subjects(
     request: Request,
     current_user: User = Depends(get_current_active_user),
-    db=Depends(db_manager.get_db)
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
 ):
     return db_manager.get_unique_subjects(db)
 
+# Лучшие и худшие студенты сразу по каждому курсу
+@router.get("/subjects/top", response_model=List[RankedStudentResponse])
+@cache_response("top_students")
+async def get_top_students_per_subject(
+    request: Request,
+    k: int = Query(10, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_ranked_students(db, k=k)
+
+@router.get("/subjects/bottom", response_model=List[RankedStudentResponse])
+@cache_response("bottom_students")
+async def get_bottom_students_per_subject(
+    request: Request,
+    k: int = Query(10, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_ranked_students(db, k=k, ascending=True)
+
+# Топ-k, последние k и диапазон оценок внутри одного курса
+@router.get("/subjects/{subject}/top", response_model=List[RankedStudentResponse])
+@cache_response("top_students")
+async def get_top_students(
+    request: Request,
+    subject: str,
+    k: int = Query(10, ge=1, le=1000),
+    score_min: Optional[int] = None,
+    score_max: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_ranked_students(db, subject, k, False, score_min, score_max)
+
+@router.get("/subjects/{subject}/bottom", response_model=List[RankedStudentResponse])
+@cache_response("bottom_students")
+async def get_bottom_students(
+    request: Request,
+    subject: str,
+    k: int = Query(10, ge=1, le=1000),
+    score_min: Optional[int] = None,
+    score_max: Optional[int] = None,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_ranked_students(db, subject, k, True, score_min, score_max)
+
+@router.get("/subjects/{subject}/range", response_model=List[StudentResponse])
+@cache_response("students_by_score_range")
+async def get_students_by_score_range(
+    request: Request,
+    subject: str,
+    score_min: Optional[int] = None,
+    score_max: Optional[int] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_students_by_score_range(db, subject, score_min, score_max, skip, limit)
+
+# Средние баллы всех факультетов (при by_subject - всех курсов) одним запросом
+@router.get("/faculty/average_scores")
+@cache_response("faculty_average_scores")
+async def get_average_scores(
+    request: Request,
+    faculty: Optional[List[str]] = Query(None),
+    by_subject: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_average_scores(db, faculty, by_subject)
+
+# Распределение оценок (count, mean, stddev, p50/p90/p99, гистограмма) для всех групп сразу
+@router.get("/analytics/distribution")
+@cache_response("score_distribution")
+async def get_score_distribution(
+    request: Request,
+    group_by: str = "faculty",
+    bucket_size: int = Query(10, ge=1),
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    if group_by not in ("faculty", "subject"):
+        raise HTTPException(status_code=400, detail="group_by must be 'faculty' or 'subject'")
+    return db_manager.get_score_distribution(db, group_by, bucket_size)
+
+# Маршруты для работы с отдельными студентами
+@router.post("/students/", response_model=StudentResponse)
+def create_student(
+    student: StudentCreate,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    db_student = db_manager.insert_student(db, student.dict())
+    if db_student is None:
+        raise HTTPException(status_code=400, detail="Student could not be created")
+    return db_student
+
+@router.get("/students/{student_id}", response_model=StudentResponse)
+def read_student(
+    student_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    db_student = db_manager.get_student(db, student_id)
+    if db_student is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return db_student
+
+@router.put("/students/{student_id}", response_model=StudentResponse)
+def update_student(
+    student_id: int,
+    student: StudentUpdate,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    db_student = db_manager.update_student(db, student_id, student.dict(exclude_unset=True))
+    if db_student is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return db_student
+
+@router.delete("/students/{student_id}")
+def delete_student(
+    student_id: int,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    success = db_manager.delete_student(db, student_id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Student not found")
+    return {"message": "Student deleted successfully"}
+
+@router.get("/faculty/{faculty_name}/average_score")
+def get_average_score_by_faculty(
+    faculty_name: str,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    average = db_manager.get_average_score_by_faculty(db, faculty_name)
+    return {"faculty": faculty_name, "average_score": average}
+
+@router.get("/students/low_score/{subject}", response_model=List[StudentResponse])
+def get_low_score_students(
+    subject: str,
+    threshold: int = 30,
+    current_user: User = Depends(get_current_active_user),
+    db=Depends(get_db),
+    db_manager: DatabaseManager = Depends(get_db_manager)
+):
+    return db_manager.get_low_score_students_by_subject(db, subject, threshold)
+
+def create_limiter_classes():
+    classes = []
+    for name, config in CONCURRENCY_CLASSES.items():
+        config = dict(config)
+        routes = config.pop("routes")
+        limiter = AIMDLimiter(name, metrics=limiter_metrics, **config)
+        classes.extend((method, pattern, limiter) for method, pattern in routes)
+    return classes
+
+# Ресурсы открываются при старте воркера и закрываются при его остановке
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    resources = app.state.resources
+    await run_in_threadpool(resources.open)
+    yield
+    resources.close()
+
+def create_app(settings: Optional[Settings] = None):
+    settings = settings or Settings()
+    app = FastAPI(lifespan=lifespan)
+    app.state.settings = settings
+    app.state.resources = AppResources(settings)
+    # Лимитер внутри conditional_get: ответы 304 из него не занимают места в лимите
+    app.add_middleware(ConcurrencyLimitMiddleware, classes=create_limiter_classes())
+    app.middleware("http")(conditional_get)
+    app.middleware("http")(collect_metrics)
+    app.add_middleware(
+        ProfilingMiddleware,
+        signer=profile_signer,
+        store=profile_store,
+        interval=PROFILE_SAMPLE_INTERVAL,
+    )
+    app.include_router(router)
+    return app
+
+# Инициализация приложения
+app = create_app()
+
 
+# Явный шаг миграции: схема обновляется один раз до запуска воркеров
 def main():
-    # Инициализация базы данных
+    settings = Settings()
+    db_manager = DatabaseManager(settings.database_url)
+    db_manager.migrate()
     db_generator = db_manager.get_db()
     db = next(db_generator)
 
@@ -300,7 +1940,7 @@ def main():
             ))
         
         # Проверяем подключение к Redis
-        redis_client.ping()
+        redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db).ping()
         print("Connected to Redis successfully")
     except redis.ConnectionError:
         print("Failed to connect to Redis")
@@ -308,7 +1948,12 @@ def main():
         print(f"An error occurred: {e}")
     finally:
         db.close()
+        db_manager.engine.dispose()
 
+# python main.py migrate - только миграция, python main.py - миграция и запуск сервера
 if __name__ == "__main__":
+    import sys
     import uvicorn
-   
+    main()
+    if sys.argv[1:] != ["migrate"]:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
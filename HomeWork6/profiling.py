@@ -0,0 +1,139 @@
+import hashlib
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Профилирование отдельных запросов по подписанному заголовку. Пока запрос выполняется,
+# фоновый поток снимает стеки потока событийного цикла и потоков пула AnyIO, в которых
+# FastAPI выполняет синхронный код. Результат сохраняется в формате collapsed stacks
+# (одна строка "кадр;кадр;кадр число_выборок"), который понимают flamegraph.pl и speedscope
+
+PROFILE_HEADER = b"x-debug-profile"
+
+# Верхние кадры простаивающих потоков пула - такие выборки не относятся к запросу
+IDLE_FUNCTIONS = {"wait", "get", "select", "_worker"}
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, loop_thread_id, interval=0.001):
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        threads = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.loop_thread_id:
+                root = "event-loop"
+            elif threads.get(thread_id, "").startswith("AnyIO worker thread"):
+                if frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                root = "worker-thread"
+            else:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(root)
+            self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+# Подпись токена профилирования: токен действует для одного пути до момента expires
+class ProfileSigner:
+    def __init__(self, secret):
+        self.secret = secret.encode()
+
+    def _signature(self, path, expires):
+        return hmac.new(self.secret, f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+
+    def create_token(self, path, ttl):
+        expires = int(time.time()) + ttl
+        return f"{expires}.{self._signature(path, expires)}", expires
+
+    def verify(self, token, path):
+        expires, _, signature = token.partition(".")
+        if not expires.isdigit() or int(expires) < time.time():
+            return False
+        return hmac.compare_digest(signature, self._signature(path, int(expires)))
+
+
+# Кольцевой буфер профилей на диске: хранится не больше max_profiles последних файлов
+class ProfileStore:
+    def __init__(self, directory, max_profiles=50):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def save(self, path, collapsed):
+        slug = re.sub(r"[^\w-]+", "_", path).strip("_") or "root"
+        name = f"{time.time_ns()}-{slug}.collapsed"
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+                f.write(collapsed)
+            for old_name in self.names()[self.max_profiles:]:
+                os.remove(os.path.join(self.directory, old_name))
+        return name
+
+    # Имена профилей, новые первыми
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory) if name.endswith(".collapsed")), reverse=True)
+
+    def read(self, name):
+        if name not in self.names():
+            return None
+        with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+            return f.read()
+
+
+# ASGI middleware: без заголовка X-Debug-Profile запрос проходит дальше после
+# одного просмотра списка заголовков
+class ProfilingMiddleware:
+    def __init__(self, app, signer, store, interval=0.001):
+        self.app = app
+        self.signer = signer
+        self.store = store
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        token = next((value for name, value in scope["headers"] if name == PROFILE_HEADER), None)
+        if token is None or not self.signer.verify(token.decode("latin-1"), scope["path"]):
+            return await self.app(scope, receive, send)
+
+        profiler = SamplingProfiler(threading.get_ident(), self.interval)
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            self.store.save(scope["path"], profiler.collapsed())
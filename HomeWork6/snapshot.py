@@ -0,0 +1,248 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import redis
+import sqlalchemy
+
+from main import DatabaseManager, Faculty, Settings, Student, Subject, bump_data_version
+
+# Снимок таблицы студентов в колоночном двоичном формате: каталог с массивами
+# NumPy (.npy) по одному на колонку и meta.json. Строковые колонки хранятся словарем:
+# <колонка>.codes.npy - индексы int32, <колонка>.dict.npy - уникальные значения
+# (строки фиксированной длины); код NULL_CODE - пустое значение. Все файлы
+# открываются через np.load(mmap_mode="r"), так что аналитика может читать снимок
+# без загрузки в память:
+#   python snapshot.py export students.snap
+#   python snapshot.py restore students.snap
+#   python snapshot.py bench --rows 100000     # восстановление против импорта CSV
+
+FORMAT_VERSION = 1
+NUMERIC_COLUMNS = {"id": np.int64, "score": np.int32}
+STRING_COLUMNS = ("surname", "name", "faculty", "subject")
+NULL_CODE = -1
+FETCH_CHUNK = 100000
+INSERT_CHUNK = 50000
+
+
+# Словарное кодирование: уникальные значения и индексы строк в них
+def encode_strings(values):
+    values = np.asarray(values, dtype=object)
+    null = np.equal(values, None)
+    dictionary, codes = np.unique(values[~null].astype(str), return_inverse=True)
+    result = np.full(len(values), NULL_CODE, dtype=np.int32)
+    result[~null] = codes
+    return dictionary, result
+
+
+# Коды факультетов и курсов в таблице - это уже словарь; они переводятся в плотные
+# индексы по справочнику, упорядоченному по коду
+def encode_codes(db, model, ids):
+    reference = db.query(model.id, model.name).order_by(model.id).all()
+    reference_ids = np.array([row[0] for row in reference], dtype=np.int64)
+    dictionary = np.array([row[1] for row in reference], dtype=str)
+    ids = np.asarray(ids, dtype=object)
+    null = np.equal(ids, None)
+    codes = np.full(len(ids), NULL_CODE, dtype=np.int32)
+    codes[~null] = np.searchsorted(reference_ids, ids[~null].astype(np.int64))
+    return dictionary, codes
+
+
+def export_snapshot(manager, path):
+    with manager.SessionLocal() as db:
+        columns = {name: [] for name in ("id", "surname", "name", "faculty_id", "subject_id", "score")}
+        result = db.execute(sqlalchemy.select(
+            Student.id, Student.surname, Student.name, Student.faculty_id, Student.subject_id, Student.score,
+        ).order_by(Student.id))
+        while True:
+            rows = result.fetchmany(FETCH_CHUNK)
+            if not rows:
+                break
+            for name, values in zip(columns, zip(*rows)):
+                columns[name].extend(values)
+
+        arrays = {name: np.array(columns[name], dtype=dtype) for name, dtype in NUMERIC_COLUMNS.items()}
+        strings = {
+            "surname": encode_strings(columns["surname"]),
+            "name": encode_strings(columns["name"]),
+            "faculty": encode_codes(db, Faculty, columns["faculty_id"]),
+            "subject": encode_codes(db, Subject, columns["subject_id"]),
+        }
+
+    # снимок пишется во временный каталог и подменяет старый одним переименованием
+    target = os.path.abspath(path)
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), values)
+    for name, (dictionary, codes) in strings.items():
+        np.save(os.path.join(tmp, f"{name}.dict.npy"), dictionary)
+        np.save(os.path.join(tmp, f"{name}.codes.npy"), codes)
+    meta = {
+        "format": FORMAT_VERSION,
+        "table": "students",
+        "rows": len(arrays["id"]),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "columns": {
+            **{name: {"dtype": np.dtype(dtype).str} for name, dtype in NUMERIC_COLUMNS.items()},
+            **{name: {"encoding": "dictionary", "values": len(strings[name][0])} for name in STRING_COLUMNS},
+        },
+    }
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(tmp, target)
+    return meta["rows"]
+
+
+# Колонки снимка: числовые - массивами, строковые - парой (словарь, коды).
+# По умолчанию файлы отображаются в память, а не читаются
+def load_snapshot(path, mmap=True):
+    mode = "r" if mmap else None
+    with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {meta.get('format')}")
+    columns = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in NUMERIC_COLUMNS}
+    for name in STRING_COLUMNS:
+        columns[name] = (
+            np.load(os.path.join(path, f"{name}.dict.npy"), mmap_mode=mode),
+            np.load(os.path.join(path, f"{name}.codes.npy"), mmap_mode=mode),
+        )
+    return meta, columns
+
+
+# Значения колонки по словарю; NULL_CODE переводится в None
+def decode(column):
+    dictionary, codes = column
+    null = codes == NULL_CODE
+    if not null.any():
+        return dictionary[codes]
+    values = np.full(len(codes), None, dtype=object)
+    values[~null] = dictionary[codes[~null]]
+    return values
+
+
+# Восстановление заменяет содержимое таблицы студентов одной транзакцией; id
+# студентов сохраняются
+def restore_snapshot(manager, path):
+    meta, columns = load_snapshot(path)
+    with manager.SessionLocal() as db:
+        # словарь факультетов и курсов снимка переводится в коды справочников этой базы
+        reference_codes = {}
+        for name, model in (("faculty", Faculty), ("subject", Subject)):
+            dictionary, codes = columns[name]
+            mapping = np.array([manager._get_code(db, model, str(value), create=True) for value in dictionary],
+                               dtype=np.int64)
+            reference_codes[name] = decode((mapping, codes)).tolist()
+
+        rows = zip(
+            columns["id"].tolist(),
+            decode(columns["surname"]).tolist(),
+            decode(columns["name"]).tolist(),
+            reference_codes["faculty"],
+            reference_codes["subject"],
+            columns["score"].tolist(),
+        )
+        manager.replace_students(db, rows, INSERT_CHUNK)
+    return meta["rows"]
+
+
+# Время восстановления снимка против импорта того же набора из CSV
+def bench(rows, workdir, seed):
+    from benchmark import generate_students_csv
+
+    workdir = workdir or tempfile.mkdtemp(prefix="students-snapshot-")
+    os.makedirs(workdir, exist_ok=True)
+    csv_path = os.path.join(workdir, f"students_{rows}.csv")
+    if not os.path.exists(csv_path):
+        generate_students_csv(csv_path, rows, seed)
+    results = {}
+
+    def fresh_manager(name):
+        db_path = os.path.join(workdir, name)
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        manager = DatabaseManager(f"sqlite:///{db_path}")
+        manager.migrate()
+        return manager
+
+    # штатный импорт приложения: отпечатки строк и контрольные точки, как у /students/import-from-csv
+    source = fresh_manager("csv.db")
+    start = time.perf_counter()
+    with source.SessionLocal() as db:
+        source.fill_from_csv(db, csv_path)
+    results["csv_import"] = time.perf_counter() - start
+
+    snapshot_path = os.path.join(workdir, "students.snap")
+    start = time.perf_counter()
+    export_snapshot(source, snapshot_path)
+    results["snapshot_export"] = time.perf_counter() - start
+
+    target = fresh_manager("restored.db")
+    start = time.perf_counter()
+    restore_snapshot(target, snapshot_path)
+    results["snapshot_restore"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    meta, columns = load_snapshot(snapshot_path)
+    np.bincount(columns["score"], minlength=101)
+    results["snapshot_mmap_histogram"] = time.perf_counter() - start
+
+    query = "SELECT s.id, s.surname, s.name, f.name, sub.name, s.score FROM students s " \
+            "JOIN faculties f ON f.id = s.faculty_id JOIN subjects sub ON sub.id = s.subject_id ORDER BY s.id"
+    with source.engine.connect() as a, target.engine.connect() as b:
+        identical = a.execute(sqlalchemy.text(query)).all() == b.execute(sqlalchemy.text(query)).all()
+    source.engine.dispose()
+    target.engine.dispose()
+
+    snapshot_bytes = sum(entry.stat().st_size for entry in os.scandir(snapshot_path))
+    print(f"{rows} rows, CSV {os.path.getsize(csv_path) / 1e6:.1f} MB, snapshot {snapshot_bytes / 1e6:.1f} MB",
+          file=sys.stderr)
+    for name, seconds in results.items():
+        print(f"  {name:<24} {seconds * 1000:10.2f} ms", file=sys.stderr)
+    print(f"  restore / CSV import     {results['snapshot_restore'] / results['csv_import']:10.2f}", file=sys.stderr)
+    print(f"  restored table identical: {identical}", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Students table snapshot export/restore")
+    settings = Settings()
+    parser.add_argument("--db", default=settings.database_url, help="database URL")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("export", help="write a snapshot of the students table").add_argument("path")
+    commands.add_parser("restore", help="replace the students table with a snapshot").add_argument("path")
+    bench_parser = commands.add_parser("bench", help="compare snapshot restore with CSV import")
+    bench_parser.add_argument("--rows", type=int, default=100_000)
+    bench_parser.add_argument("--seed", type=int, default=42)
+    bench_parser.add_argument("--workdir", help="directory for generated files")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.rows, args.workdir, args.seed)
+        return
+    # восстановление меняет данные: версия в Redis обновляется по журналу изменений,
+    # как при записи через API, и воркеры перестают отдавать закешированные ответы
+    redis_client = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=settings.redis_db)
+    manager = DatabaseManager(args.db, on_change=lambda: bump_data_version(redis_client, manager))
+    manager.migrate()
+    try:
+        if args.command == "export":
+            print(f"Exported {export_snapshot(manager, args.path)} students to {args.path}")
+        else:
+            print(f"Restored {restore_snapshot(manager, args.path)} students from {args.path}")
+    finally:
+        manager.engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
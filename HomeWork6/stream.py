@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import json
+
+# Рассылка изменений студентов подписчикам по SSE. Один опрашивающий таск на процесс
+# читает журнал student_changes (его пишут триггеры БД, поэтому видны записи всех
+# воркеров и массовый импорт) и раскладывает события по очередям подписчиков. Каждое
+# событие сериализуется один раз, а простаивающий подписчик - это только ограниченная
+# очередь и ожидающая ее корутина. Когда подписчиков нет, журнал не опрашивается.
+# Если клиент не успевает читать, его очередь сбрасывается и он получает событие
+# resync: пропущенное нужно догнать через GET /students/changes?since=
+
+RESYNC = object()
+
+
+class Subscription:
+    def __init__(self, faculty=None, subject=None, max_queue=100, since=None):
+        self.faculty = faculty
+        self.subject = subject
+        self.queue = asyncio.Queue(max_queue)
+        # версия последнего события, отправленного клиенту
+        self.last_version = since
+
+    def matches(self, event):
+        return ((self.faculty is None or self.faculty in event["faculties"])
+                and (self.subject is None or self.subject in event["subjects"]))
+
+    # False - очередь переполнилась и была заменена на resync
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            return False
+
+    # Байты потока text/event-stream; комментарий keepalive не дает прокси закрыть
+    # простаивающее соединение
+    async def stream(self, keepalive=15.0):
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(self.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if event is RESYNC:
+                data = json.dumps({"since": self.last_version or 0})
+                yield f"event: resync\ndata: {data}\n\n".encode()
+                continue
+            self.last_version = event["version"]
+            yield event["payload"]
+
+
+class ChangeBroadcaster:
+    # fetch(since, limit) возвращает события журнала после версии since по порядку,
+    # latest_version() - текущую версию журнала. Обе функции синхронные и
+    # выполняются в пуле потоков
+    def __init__(self, fetch, latest_version, poll_interval=0.5, batch_size=1000, max_queue=100, metrics=None):
+        self.fetch = fetch
+        self.latest_version = latest_version
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_queue = max_queue
+        self.metrics = metrics
+        self.version = None
+        self.subscribers = set()
+        self._task = None
+        self._start_lock = None
+
+    async def subscribe(self, faculty=None, subject=None, since=None):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self.version is None:
+                self.version = await asyncio.to_thread(self.latest_version)
+            subscription = Subscription(faculty, subject, self.max_queue, since)
+            if since is None:
+                subscription.last_version = self.version
+            elif since < self.version:
+                # клиент переподключился после пропуска событий
+                subscription.put(RESYNC)
+            self.subscribers.add(subscription)
+            if self._task is None:
+                # пустой контекст: опрос не должен учитываться как запросы к БД
+                # HTTP-запроса, открывшего первую подписку
+                self._task = asyncio.create_task(self._run(), context=contextvars.Context())
+        self._update_metrics()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        self._update_metrics()
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    events = await asyncio.to_thread(self.fetch, self.version, self.batch_size)
+                except Exception as e:
+                    print(f"Change stream poll failed: {e}")
+                    events = []
+                for event in events:
+                    self.publish(event)
+                if len(events) < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            # без подписчиков версия не отслеживается: новый подписчик начнет с текущей
+            self._task = None
+            self.version = None
+
+    def publish(self, event):
+        self.version = event["version"]
+        targets = [subscription for subscription in self.subscribers if subscription.matches(event)]
+        if not targets:
+            return
+        data = json.dumps(event["data"], ensure_ascii=False, default=str)
+        event = {"version": event["version"], "payload": f"id: {event['version']}\nevent: change\ndata: {data}\n\n".encode()}
+        for subscription in targets:
+            if not subscription.put(event) and self.metrics is not None:
+                self.metrics["resyncs"].inc()
+
+    def _update_metrics(self):
+        if self.metrics is not None:
+            self.metrics["subscribers"].set(len(self.subscribers))
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.subscribers.clear()
+        self._update_metrics()
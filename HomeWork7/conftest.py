@@ -0,0 +1,5 @@
+import os
+
+# Тесты работают с локальной базой без отдельного шага "python main.py migrate":
+# схема создается при первом обращении к БД
+os.environ.setdefault("AUTO_MIGRATE", "1")
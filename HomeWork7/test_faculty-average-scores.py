@@ -0,0 +1,102 @@
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
+
+def test_average_scores_all_faculties():
+    """Тест получения средних баллов по всем факультетам одним запросом"""
+    # Регистрируем и логиним пользователя
+    client.post("/auth/register", json={
+        "username": "averageuser",
+        "email": "average@example.com",
+        "password": "averagepass"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "averageuser", "password": "averagepass"}
+    )
+    token = login_response.json()["access_token"]
+
+    # Добавляем студентов двух факультетов
+    for faculty, score in [("СРЕДФАК1", 40), ("СРЕДФАК1", 60), ("СРЕДФАК2", 90)]:
+        client.post("/students/",
+            json={
+                "surname": "Средний",
+                "name": "Студент",
+                "faculty": faculty,
+                "subject": "Статистика",
+                "score": score
+            },
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    # Запрашиваем только эти факультеты
+    response = client.get("/faculty/average_scores",
+        params={"faculty": ["СРЕДФАК1", "СРЕДФАК2"]},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    scores = {item["faculty"]: item for item in response.json()}
+    assert set(scores) == {"СРЕДФАК1", "СРЕДФАК2"}
+    assert scores["СРЕДФАК1"]["min_score"] == 40
+    assert scores["СРЕДФАК1"]["max_score"] == 60
+    assert scores["СРЕДФАК2"]["count"] >= 1
+
+def test_average_scores_unknown_faculty():
+    """Тест фильтра по несуществующему факультету"""
+    client.post("/auth/register", json={
+        "username": "averageuser2",
+        "email": "average2@example.com",
+        "password": "averagepass2"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "averageuser2", "password": "averagepass2"}
+    )
+    token = login_response.json()["access_token"]
+
+    response = client.get("/faculty/average_scores",
+        params={"faculty": "NONEXISTENT"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == []
+
+def test_average_scores_by_subject():
+    """Тест средних баллов по курсам: одна запись на курс, а не на пару факультет/курс"""
+    client.post("/auth/register", json={
+        "username": "averageuser3",
+        "email": "average3@example.com",
+        "password": "averagepass3"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "averageuser3", "password": "averagepass3"}
+    )
+    token = login_response.json()["access_token"]
+
+    # Один курс на двух факультетах
+    for faculty, score in [("КУРСФАК1", 30), ("КУРСФАК2", 70)]:
+        client.post("/students/",
+            json={
+                "surname": "Курсов",
+                "name": "Студент",
+                "faculty": faculty,
+                "subject": "Общий курс",
+                "score": score
+            },
+            headers={"Authorization": f"Bearer {token}"}
+        )
+
+    response = client.get("/faculty/average_scores",
+        params={"faculty": ["КУРСФАК1", "КУРСФАК2"], "by_subject": True},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    [item] = response.json()
+    assert "faculty" not in item
+    assert item["subject"] == "Общий курс"
+    assert item["average_score"] == 50.0
+    assert item["min_score"] == 30
+    assert item["max_score"] == 70
+    assert item["count"] >= 2
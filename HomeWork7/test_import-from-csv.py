@@ -1,5 +1,10 @@
 import os
+import sqlite3
 import tempfile
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
 
 def test_import_csv_success():
     """Тест успешного импорта из CSV"""
@@ -58,3 +63,131 @@ def test_import_csv_file_not_found():
     assert response.status_code == 400
     assert "detail" in response.json()
     assert "File not found" in response.json()["detail"]
+
+def test_import_csv_repeated():
+    """Тест повторного импорта того же CSV без дубликатов"""
+    csv_content = """Фамилия,Имя,Факультет,Курс,Оценка
+Повторимов,Иван,ФТФ,Математика,90
+Повторимов,Петр,ФПМИ,Физика,85"""
+
+    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv', encoding='utf-8') as tmp:
+        tmp.write(csv_content)
+        tmp_path = tmp.name
+
+    # Регистрируем и логиним пользователя
+    client.post("/auth/register", json={
+        "username": "csvuser3",
+        "email": "csv3@example.com",
+        "password": "csvpass3"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "csvuser3", "password": "csvpass3"}
+    )
+    token = login_response.json()["access_token"]
+
+    # Импортируем файл дважды; фоновая задача выполняется до возврата ответа
+    for _ in range(2):
+        response = client.post("/students/import-from-csv",
+            json={"file_path": tmp_path},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+
+    os.unlink(tmp_path)
+
+    # Обе строки файла загружены (включая первую) и ровно по одному разу
+    response = client.get("/students/search",
+        params={"q": "Повторимов"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    assert sorted(student["name"] for student in response.json()) == ["Иван", "Петр"]
+
+def test_import_csv_after_legacy_migration():
+    """Тест повторного импорта после миграции со старой схемы"""
+    from main import DatabaseManager, Student
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "legacy.db")
+    csv_path = os.path.join(workdir, "students.csv")
+    rows = [("Старов", "Иван", "ФТФ", "Математика", 90), ("Старов", "Петр", "ФПМИ", "Физика", 85)]
+
+    # База старой схемы: факультет и курс хранятся строками в каждой записи
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE students (id INTEGER PRIMARY KEY, surname VARCHAR, name VARCHAR, "
+                     "faculty VARCHAR, subject VARCHAR, score INTEGER)")
+        conn.executemany("INSERT INTO students (surname, name, faculty, subject, score) VALUES (?, ?, ?, ?, ?)", rows)
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("Фамилия,Имя,Факультет,Курс,Оценка\n")
+        f.writelines(",".join(map(str, row)) + "\n" for row in rows)
+
+    manager = DatabaseManager(f"sqlite:///{db_path}")
+    manager.migrate()
+    with manager.SessionLocal() as db:
+        # перенесенные строки получили отпечатки, и тот же файл ничего не добавляет
+        assert db.query(Student).filter(Student.fingerprint.is_(None)).count() == 0
+        assert manager.fill_from_csv(db, csv_path) == 0
+        assert db.query(Student).count() == 2
+    manager.engine.dispose()
+
+def test_import_csv_without_fingerprint_scan():
+    """Тест отпечатков студентов, добавленных и измененных через API"""
+    from main import DatabaseManager, Student
+
+    workdir = tempfile.mkdtemp()
+    csv_path = os.path.join(workdir, "students.csv")
+    manager = DatabaseManager(f"sqlite:///{os.path.join(workdir, 'api.db')}")
+    manager.migrate()
+    scans = []
+    fill_fingerprints = manager._fill_fingerprints
+    manager._fill_fingerprints = lambda conn: scans.append(conn) or fill_fingerprints(conn)
+
+    student = {"surname": "Апишин", "name": "Иван", "faculty": "ФТФ", "subject": "Математика", "score": 90}
+    with manager.SessionLocal() as db:
+        first = manager.insert_student(db, student)
+        # одинаковая строка получает отпечаток дубликата, а не NULL
+        second = manager.insert_student(db, student)
+        changed = manager.insert_student(db, dict(student, name="Петр"))
+        manager.update_student(db, changed.id, {"score": 75})
+        assert db.query(Student).filter(Student.fingerprint.is_(None)).count() == 0
+        assert second.fingerprint == f"{first.fingerprint}:{second.id}"
+
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write("Фамилия,Имя,Факультет,Курс,Оценка\n")
+        f.write("Апишин,Иван,ФТФ,Математика,90\n")
+        f.write("Апишин,Петр,ФТФ,Математика,75\n")
+        f.write("Апишин,Петр,ФТФ,Математика,90\n")
+
+    with manager.SessionLocal() as db:
+        # добавлена только строка со старой оценкой измененного студента
+        assert manager.fill_from_csv(db, csv_path) == 1
+        assert db.query(Student).count() == 4
+    # таблицу в поисках строк без отпечатка импорт не просматривал
+    assert scans == []
+    manager.engine.dispose()
+
+def test_reference_codes_cached_after_commit():
+    """Тест кеша кодов справочников при откате и фиксации транзакции"""
+    from main import DatabaseManager, Faculty
+
+    workdir = tempfile.mkdtemp()
+    manager = DatabaseManager(f"sqlite:///{os.path.join(workdir, 'codes.db')}")
+    manager.migrate()
+
+    with manager.SessionLocal() as db:
+        rolled_back = manager._get_code(db, Faculty, "ОТКАТ", create=True)
+        # своя сессия видит добавленный код, общий кеш - нет
+        assert manager._get_code(db, Faculty, "ОТКАТ") == rolled_back
+        assert "ОТКАТ" not in manager._codes[Faculty]
+        db.rollback()
+    with manager.SessionLocal() as db:
+        manager._get_code(db, Faculty, "ЗАКРЫТИЕ", create=True)
+    # сессия закрыта без commit
+    assert "ЗАКРЫТИЕ" not in manager._codes[Faculty]
+
+    with manager.SessionLocal() as db:
+        assert manager._get_code(db, Faculty, "ОТКАТ") is None
+        code = manager._get_code(db, Faculty, "ФИКСАЦИЯ", create=True)
+        db.commit()
+    assert manager._codes[Faculty] == {"ФИКСАЦИЯ": code}
+    manager.engine.dispose()
@@ -0,0 +1,105 @@
+from fastapi.testclient import TestClient
+from main import DATA_VERSION_KEY, app
+
+client = TestClient(app)
+
+def test_students_not_modified():
+    """Тест условного запроса списка студентов по ETag"""
+    # Регистрируем и логиним пользователя
+    client.post("/auth/register", json={
+        "username": "etaguser",
+        "email": "etag@example.com",
+        "password": "etagpass"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "etaguser", "password": "etagpass"}
+    )
+    token = login_response.json()["access_token"]
+
+    response = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    # Повторный запрос с тем же ETag не возвращает тело
+    response = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+def test_students_etag_changes_after_write():
+    """Тест смены ETag после добавления студента"""
+    client.post("/auth/register", json={
+        "username": "etaguser2",
+        "email": "etag2@example.com",
+        "password": "etagpass2"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "etaguser2", "password": "etagpass2"}
+    )
+    token = login_response.json()["access_token"]
+
+    etag = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}"}
+    ).headers["ETag"]
+
+    client.post("/students/",
+        json={
+            "surname": "Изменов",
+            "name": "Студент",
+            "faculty": "ЕТАГФАК",
+            "subject": "Кеширование",
+            "score": 50
+        },
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    response = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_students_etag_after_redis_restart():
+    """Тест ETag после потери версии данных в Redis"""
+    client.post("/auth/register", json={
+        "username": "etaguser3",
+        "email": "etag3@example.com",
+        "password": "etagpass3"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "etaguser3", "password": "etagpass3"}
+    )
+    token = login_response.json()["access_token"]
+
+    old_etag = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}"}
+    ).headers["ETag"]
+    client.post("/students/",
+        json={
+            "surname": "Перезапусков",
+            "name": "Студент",
+            "faculty": "ЕТАГФАК",
+            "subject": "Кеширование",
+            "score": 60
+        },
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    etag = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}"}
+    ).headers["ETag"]
+
+    # Redis перезапущен: версия данных читается из журнала изменений в БД,
+    # поэтому ETag до записи не совпадает, а текущий остается прежним
+    app.state.resources.redis.delete(DATA_VERSION_KEY)
+    response = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": old_etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] == etag
+    response = client.get("/students/",
+        headers={"Authorization": f"Bearer {token}", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
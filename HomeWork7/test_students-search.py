@@ -0,0 +1,58 @@
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
+
+def test_search_students_by_surname_prefix():
+    """Тест поиска студентов по префиксу фамилии"""
+    # Регистрируем и логиним пользователя
+    client.post("/auth/register", json={
+        "username": "searchuser",
+        "email": "search@example.com",
+        "password": "searchpass"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "searchuser", "password": "searchpass"}
+    )
+    token = login_response.json()["access_token"]
+
+    # Добавляем студента с редкой фамилией
+    client.post("/students/",
+        json={
+            "surname": "Поисковиков",
+            "name": "Искатель",
+            "faculty": "ПОИСКФАК",
+            "subject": "Поисковедение",
+            "score": 77
+        },
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    # Ищем по началу фамилии в нижнем регистре
+    response = client.get("/students/search",
+        params={"q": "поисков"},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 200
+    assert len(response.json()) > 0
+    assert all(s["surname"].startswith("Поисков") for s in response.json())
+
+def test_search_students_empty_query():
+    """Тест поиска с пустым запросом"""
+    client.post("/auth/register", json={
+        "username": "searchuser2",
+        "email": "search2@example.com",
+        "password": "searchpass2"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": "searchuser2", "password": "searchpass2"}
+    )
+    token = login_response.json()["access_token"]
+
+    response = client.get("/students/search",
+        params={"q": ""},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 422
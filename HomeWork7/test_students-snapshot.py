@@ -0,0 +1,75 @@
+import os
+import tempfile
+from sqlalchemy import text
+from main import DatabaseManager, Faculty, Student, Subject
+from snapshot import export_snapshot, restore_snapshot
+
+ROWS_QUERY = """
+    SELECT s.id, s.surname, s.name, f.name, sub.name, s.score FROM students s
+    LEFT JOIN faculties f ON f.id = s.faculty_id
+    LEFT JOIN subjects sub ON sub.id = s.subject_id
+    ORDER BY s.id
+"""
+
+def create_manager(path):
+    manager = DatabaseManager(f"sqlite:///{path}")
+    manager.migrate()
+    return manager
+
+def add_student(manager, db, surname, name, faculty, subject, score):
+    student = Student(
+        surname=surname,
+        name=name,
+        faculty_id=manager._get_code(db, Faculty, faculty, create=True),
+        subject_id=manager._get_code(db, Subject, subject, create=True),
+        score=score,
+    )
+    db.add(student)
+    db.flush()
+    return student.id
+
+def test_snapshot_round_trip():
+    """Тест выгрузки и восстановления снимка таблицы студентов"""
+    workdir = tempfile.mkdtemp()
+    source = create_manager(os.path.join(workdir, "source.db"))
+    target = create_manager(os.path.join(workdir, "target.db"))
+
+    with source.SessionLocal() as db:
+        add_student(source, db, "Снимков", "Иван", "ФИЗФАК", "Механика", 90)
+        removed_id = add_student(source, db, "Удаленный", "Петр", "ФИЗФАК", "Механика", 40)
+        add_student(source, db, "Снимкова", "Анна", "МЕХМАТ", "Алгебра", 75)
+        # студент без факультета и курса
+        add_student(source, db, "Бездомный", "Олег", None, None, 60)
+        # в снимке есть пропуск в id
+        db.query(Student).filter(Student.id == removed_id).delete()
+        db.commit()
+        source_rows = db.execute(text(ROWS_QUERY)).all()
+        source_codes = dict(db.query(Faculty.name, Faculty.id).all())
+
+    # В целевой базе справочники заполнены в другом порядке, и в ней есть студент,
+    # которого восстановление заменит
+    with target.SessionLocal() as db:
+        add_student(target, db, "Заменяемый", "Павел", "МЕХМАТ", "Алгебра", 35)
+        add_student(target, db, "Заменяемый", "Сергей", "ХИМФАК", "Органика", 30)
+        db.commit()
+
+    snapshot_path = os.path.join(workdir, "students.snap")
+    assert export_snapshot(source, snapshot_path) == 3
+    assert restore_snapshot(target, snapshot_path) == 3
+
+    with target.SessionLocal() as db:
+        # id студентов сохранены, названия совпадают, хотя коды справочников другие
+        assert db.execute(text(ROWS_QUERY)).all() == source_rows
+        assert [row[0] for row in source_rows] == [1, 3, 4]
+        target_codes = dict(db.query(Faculty.name, Faculty.id).all())
+        assert all(target_codes[name] != code for name, code in source_codes.items())
+        restored = db.get(Student, 4)
+        assert restored.faculty_id is None and restored.subject_id is None
+
+        # полнотекстовый индекс перестроен по восстановленной таблице
+        db.execute(text("INSERT INTO students_fts(students_fts) VALUES ('integrity-check')"))
+        assert sorted(student.id for student in target.search_students(db, "Снимков")) == [1, 3]
+        assert target.search_students(db, "Заменяемый") == []
+
+    source.engine.dispose()
+    target.engine.dispose()
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import uuid
+from urllib.parse import urlencode
+from fastapi.testclient import TestClient
+from main import app
+
+client = TestClient(app)
+
+def get_token(username):
+    # Регистрируем и логиним пользователя
+    client.post("/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": f"{username}pass"
+    })
+    login_response = client.post("/auth/token",
+        data={"username": username, "password": f"{username}pass"}
+    )
+    return login_response.json()["access_token"]
+
+def create_student(token, surname, faculty):
+    response = client.post("/students/",
+        json={
+            "surname": surname,
+            "name": "Студент",
+            "faculty": faculty,
+            "subject": "Потоки",
+            "score": 70
+        },
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    return response.json()["id"]
+
+def read_events(token, count, params=None, headers=None, on_open=None, timeout=15):
+    # TestClient дожидается конца ответа, а поток бесконечный, поэтому поток читается
+    # прямо через ASGI: после count событий клиент "отключается". on_open вызывается
+    # в отдельном потоке один раз, когда подписка уже оформлена
+    events = []
+    buffer = b""
+    disconnected = asyncio.Event()
+    request_sent = False
+    opened = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal buffer, opened
+        if message["type"] == "http.response.start":
+            assert message["status"] == 200
+            return
+        if message["type"] != "http.response.body" or disconnected.is_set():
+            return
+        if not opened and on_open is not None:
+            opened = True
+            asyncio.get_running_loop().run_in_executor(None, on_open)
+        buffer += message.get("body", b"")
+        *complete, buffer = buffer.split(b"\n\n")
+        for block in complete:
+            fields = dict(line.split(": ", 1) for line in block.decode().split("\n") if ": " in line)
+            # retry и комментарии keepalive не события
+            if "event" in fields:
+                events.append(fields)
+        if len(events) >= count:
+            disconnected.set()
+
+    request_headers = {"Authorization": f"Bearer {token}", **(headers or {})}
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/students/stream",
+        "raw_path": b"/students/stream",
+        "root_path": "",
+        "query_string": urlencode(params or {}).encode(),
+        "headers": [(b"host", b"testserver")]
+            + [(name.lower().encode(), value.encode()) for name, value in request_headers.items()],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), timeout))
+    return events
+
+def latest_version(token):
+    # Текущая версия журнала: листаем ленту изменений до конца
+    since = 0
+    while True:
+        data = client.get("/students/changes",
+            params={"since": since, "limit": 10000},
+            headers={"Authorization": f"Bearer {token}"}
+        ).json()
+        since = data["next_since"]
+        if not data["has_more"]:
+            return since
+
+def test_stream_unauthorized():
+    """Тест подписки на поток без авторизации"""
+    response = client.get("/students/stream")
+    assert response.status_code == 401
+
+def test_stream_faculty_filter():
+    """Тест фильтра потока изменений по факультету"""
+    token = get_token("streamuser")
+    faculty = f"ПОТОК{uuid.uuid4().hex[:8]}"
+    created = []
+
+    def write():
+        created.append(create_student(token, "Первый", faculty))
+        created.append(create_student(token, "Чужой", faculty + "-ДРУГОЙ"))
+        created.append(create_student(token, "Второй", faculty))
+
+    events = read_events(token, 2, params={"faculty": faculty}, on_open=write)
+
+    # событие о студенте другого факультета подписчику не приходит
+    assert [event["event"] for event in events] == ["change", "change"]
+    data = [json.loads(event["data"]) for event in events]
+    assert [item["student_id"] for item in data] == [created[0], created[2]]
+    assert all(item["op"] == "insert" and item["student"]["faculty"] == faculty for item in data)
+    # id события - версия журнала, ее EventSource пришлет в Last-Event-ID
+    assert [int(event["id"]) for event in events] == [item["version"] for item in data]
+
+def test_stream_last_event_id_current():
+    """Тест переподключения с актуальным Last-Event-ID"""
+    token = get_token("streamuser2")
+    faculty = f"ПОТОК{uuid.uuid4().hex[:8]}"
+    create_student(token, "Ранний", faculty)
+    version = latest_version(token)
+    created = []
+
+    events = read_events(token, 1,
+        params={"faculty": faculty},
+        headers={"Last-Event-ID": str(version)},
+        on_open=lambda: created.append(create_student(token, "Поздний", faculty)),
+    )
+
+    # пропущенных событий нет: первым приходит новое изменение, а не resync
+    assert events[0]["event"] == "change"
+    assert json.loads(events[0]["data"])["student_id"] == created[0]
+    assert int(events[0]["id"]) > version
+
+def test_stream_last_event_id_resync():
+    """Тест resync при переподключении после пропущенных событий"""
+    token = get_token("streamuser3")
+    faculty = f"ПОТОК{uuid.uuid4().hex[:8]}"
+    create_student(token, "Пропущенный", faculty)
+    version = latest_version(token)
+
+    # клиент видел события до version - 1; изменение version он пропустил
+    events = read_events(token, 1, headers={"Last-Event-ID": str(version - 1)})
+
+    assert events[0]["event"] == "resync"
+    assert json.loads(events[0]["data"]) == {"since": version - 1}
+
+    # пропущенное догоняется через ленту изменений
+    response = client.get("/students/changes",
+        params={"since": version - 1},
+        headers={"Authorization": f"Bearer {token}"}
+    )
+    assert [change["version"] for change in response.json()["changes"]] == [version]